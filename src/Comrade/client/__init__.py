@@ -1,2 +1,5 @@
-from .discord_client import client
-__all__ = ["client"]
+from .discord_client import client, pipeline
+from .pipeline import (message_stage, MessageContext,
+                       exact, prefix, contains, pattern)
+__all__ = ["client", "pipeline", "message_stage", "MessageContext",
+           "exact", "prefix", "contains", "pattern"]
@@ -6,8 +6,11 @@ from config import cfg
 from utils.logger import logger
 from utils.checks import isNotThreat
 from utils.comrade_help import ComradeHelp
+from utils.echo import webhooks
+from utils.outbound import outbound
+from .pipeline import MessagePipeline
 import time
-import os
+import sys
 
 # Map prefixes
 if cfg["Settings"]["secondary-prefix"]:
@@ -37,15 +40,33 @@ slash = SlashCommand(client,
                      delete_from_unused_guilds=True)
 
 
+pipeline = MessagePipeline(client)
+
+
+def is_rate_limit(exception) -> bool:
+    return isinstance(exception, discord.HTTPException) and \
+        exception.status == 429
+
+
 # Listeners for client events
+@client.event
+async def on_message(message: discord.Message):
+    # Replaces the default command processing; commands are invoked
+    # from within the pipeline once the gate stages have passed
+    await pipeline.process(message)
+
+
+@client.event
+async def on_webhooks_update(channel: discord.abc.GuildChannel):
+    # The webhook used to mimic in the channel may have been deleted
+    webhooks.drop(channel.id)
+
+
 @client.event
 async def on_error(event, *args, **kwargs):
-    try:
-        raise Exception(event)
-    except discord.HTTPException:
-        os.system("kill 1")  # hard restart on 429
-    except Exception:
-        logger.exception(event)
+    if is_rate_limit(sys.exc_info()[1]):
+        outbound.back_off()  # slow down instead of restarting
+    logger.exception(event)
 
 
 @client.event
@@ -54,8 +75,8 @@ async def on_command_error(ctx: commands.Context, exception):
     await ctx.send(f"Error: {exception}", reference=ctx.message)
     logger.exception("Command Error", exc_info=exception)
 
-    if type(exception) == discord.HTTPException:
-        os.system("kill 1")  # hard restart on 429
+    if is_rate_limit(getattr(exception, "original", exception)):
+        outbound.back_off()  # slow down instead of restarting
 
 
 @client.before_invoke
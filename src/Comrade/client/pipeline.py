@@ -0,0 +1,272 @@
+'''
+Message pipeline for Comrade.
+Every message goes through a single on_message dispatcher, which builds
+one shared context for it and hands it to the stages registered by cogs.
+'''
+import discord
+from discord.ext import commands
+
+import re
+import time
+import asyncio
+import inspect
+
+from db import server_cfg, user_profile, RELAY_ID
+from utils.logger import logger
+
+
+class MessageContext:
+    '''
+    Per-message state shared by all pipeline stages
+    '''
+    def __init__(self, message: discord.Message, ctx: commands.Context,
+                 server: dict = None, user: dict = None):
+        self.message = message
+        self.ctx = ctx
+        self.server = server
+        # server config; None outside of a server and in the relay
+        self.user = user
+        # user profile; None for bots, webhooks and DMs
+        self.content = message.content.strip().lower()
+        # normalized content, for case-insensitive triggers
+
+
+def _scoped(regex: str, ignore_case: bool) -> str:
+    return f"(?{'i' if ignore_case else ''}:{regex})"
+
+
+def exact(*words: str, ignore_case: bool = False) -> str:
+    '''
+    Trigger for messages which are exactly one of the words
+    '''
+    return _scoped("|".join(map(re.escape, words)), ignore_case) + r"\Z"
+
+
+def prefix(*words: str, ignore_case: bool = False) -> str:
+    '''
+    Trigger for messages starting with one of the words
+    '''
+    return _scoped("|".join(map(re.escape, words)), ignore_case)
+
+
+class Keywords:
+    '''
+    Trigger for messages containing one of a few words anywhere.
+    The keywords of every stage are searched for together,
+    in a single pass over the message.
+    '''
+    __slots__ = ("words", "ignore_case")
+
+    def __init__(self, words: tuple, ignore_case: bool):
+        self.words = words
+        self.ignore_case = ignore_case
+
+    def keys(self):
+        for word in self.words:
+            yield (word.lower(), True) if self.ignore_case else (word, False)
+
+
+def contains(*words: str, ignore_case: bool = False) -> Keywords:
+    '''
+    Trigger for messages containing one of the words anywhere
+    '''
+    return Keywords(words, ignore_case)
+
+
+def pattern(regex: str) -> str:
+    '''
+    Trigger for messages in which a regular expression can be found
+    '''
+    return f"(?s:.*?)(?:{regex})"
+
+
+def message_stage(order: int, gate: bool = False, triggers: list = None):
+    '''
+    Marks a cog method as a message pipeline stage,
+    which is called with the MessageContext of every message.
+
+    Gate stages run first, one at a time in ascending order,
+    and stop the message from going any further by returning True
+    (eg. when the filter deletes it).
+    All remaining stages and the command invocation then run concurrently.
+
+    Stages which declare triggers (made with exact, prefix, contains
+    or pattern) are only called for messages matching one of them.
+    '''
+    def decorator(fn):
+        fn.__message_stage__ = (order, gate, tuple(triggers or ()))
+        return fn
+    return decorator
+
+
+class MessagePipeline:
+    '''
+    Single on_message dispatcher
+    '''
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.gates = []  # (order, stage, triggers)
+        self.stages = []
+
+        self.groups = {}
+        self.matcher = re.compile("")
+        # every regular expression trigger, compiled into one
+        self.keywords = {}  # (word, ignore case) -> stages
+        self.lengths = []
+        self.scanner = None
+        # every keyword, compiled into one alternation
+        self.triggers = set()  # stages with triggers
+
+        self.processed = 0
+        self.untriggered = 0
+        # messages which did not match any trigger
+        self.time_spent = 0
+        # time spent building contexts and running gates
+
+    def add_cog(self, cog: commands.Cog):
+        '''
+        Registers all of the stages defined in a cog
+        '''
+        registered = [s[1] for s in self.gates + self.stages]
+
+        for _, member in inspect.getmembers(cog, inspect.ismethod):
+            if (info := getattr(member, "__message_stage__", None)) and \
+                    member not in registered:
+                order, gate, triggers = info
+                target = self.gates if gate else self.stages
+                target.append((order, member, triggers))
+
+        self.compile()
+
+    def remove_cog(self, cog: commands.Cog):
+        self.gates = [s for s in self.gates if s[1].__self__ is not cog]
+        self.stages = [s for s in self.stages if s[1].__self__ is not cog]
+        self.compile()
+
+    def compile(self):
+        '''
+        Sorts the stages and builds the trigger matchers.
+        Each stage with regular expression triggers gets a named group
+        inside an optional lookahead, so a single match at the start of
+        a message tells which of the stages it triggers.
+        Keywords are merged into one alternation, longest first, which is
+        tried at every position of the message in a single pass.
+        '''
+        self.gates.sort(key=lambda s: s[0])
+        self.stages.sort(key=lambda s: s[0])
+
+        self.groups = {}  # stage -> group name
+        self.keywords = {}
+        self.triggers = set()
+        lookaheads = []
+
+        for _, stage, triggers in self.gates + self.stages:
+            if triggers:
+                self.triggers.add(stage)
+            regexes = [t for t in triggers if not isinstance(t, Keywords)]
+            for trigger in triggers:
+                if isinstance(trigger, Keywords):
+                    for key in trigger.keys():
+                        self.keywords.setdefault(key, set()).add(stage)
+
+            if regexes:
+                self.groups[stage] = group = f"t{len(lookaheads)}"
+                lookaheads.append(
+                    f"(?=(?P<{group}>{'|'.join(regexes)}))?")
+
+        self.matcher = re.compile("".join(lookaheads))
+
+        keys = sorted(self.keywords, key=lambda k: -len(k[0]))
+        self.lengths = sorted({len(word) for word, _ in keys}, reverse=True)
+        self.scanner = re.compile("(?=({}))".format("|".join(
+            _scoped(re.escape(word), ignore_case)
+            for word, ignore_case in keys))) if keys else None
+
+    def scan(self, content: str) -> set:
+        '''
+        Stages triggered by the keywords in a message
+        '''
+        hits = set()
+        if self.scanner is None:
+            return hits
+
+        for found in self.scanner.finditer(content):
+            # the longest keyword at this position was found;
+            # shorter ones there are its prefixes
+            text = found.group(1)
+            for length in self.lengths:
+                if length <= len(text):
+                    hits.update(self.keywords.get((text[:length], False), ()))
+                    hits.update(self.keywords.get(
+                        (text[:length].lower(), True), ()))
+        return hits
+
+    def triggered(self, stage, match, hits: set) -> bool:
+        return stage not in self.triggers or stage in hits or (
+            (group := self.groups.get(stage)) is not None and
+            match.group(group) is not None)
+
+    async def build_context(self, message: discord.Message) -> MessageContext:
+        '''
+        Gathers everything stages need for a message in one place
+        '''
+        ctx = await self.bot.get_context(message)
+
+        if not message.guild or message.guild.id == RELAY_ID:
+            return MessageContext(message, ctx)
+
+        user = None
+        if isinstance(message.author, discord.Member) and \
+                not message.author.bot:
+            user = await user_profile(message.author)
+
+        return MessageContext(message, ctx, server_cfg(message.guild.id), user)
+
+    async def process(self, message: discord.Message):
+        t_start = time.perf_counter()
+
+        match = self.matcher.match(message.content)
+        hits = self.scan(message.content)
+        try:
+            mc = await self.build_context(message)
+        except Exception as e:
+            # eg. the database is unreachable; commands should still work
+            logger.error("Could not build message context", exc_info=e)
+            mc = MessageContext(message, await self.bot.get_context(message))
+
+        for _, gate, _ in self.gates:
+            if not self.triggered(gate, match, hits):
+                continue
+            try:
+                stop = await gate(mc)
+            except Exception as e:
+                logger.error("Message gate error", exc_info=e)
+                continue
+            if stop:
+                self.record(t_start)
+                return
+
+        self.record(t_start)
+
+        coros = [stage(mc) for _, stage, _ in self.stages
+                 if self.triggered(stage, match, hits)]
+
+        if not hits and all(g is None for g in match.groupdict().values()):
+            self.untriggered += 1
+
+        if not message.author.bot:
+            coros.append(self.bot.invoke(mc.ctx))
+
+        for result in await asyncio.gather(*coros, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("Message stage error", exc_info=result)
+
+    def record(self, t_start: float):
+        self.processed += 1
+        self.time_spent += time.perf_counter() - t_start
+
+    def info(self) -> str:
+        avg = self.time_spent / self.processed * 1000 if self.processed else 0
+        return (f"{self.processed} messages "
+                f"({self.untriggered} without triggers), "
+                f"{round(avg, 2)} ms average pre-processing")
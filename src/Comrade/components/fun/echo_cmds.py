@@ -3,7 +3,7 @@ from discord.ext import commands
 import typing
 import random
 
-from utils.echo import echo, mimic
+from utils.echo import echo, mimic, fan_out
 from utils.checks import isNotThreat
 from utils.utilities import is_url
 from utils.logger import logger
@@ -96,5 +96,7 @@ class Echo(commands.Cog):
             await ctx.send(ctx,
                            f"That's too many members! Limit is {cfg['Performance']['everyonesays-limit']}")
         else:
-            for m in random.sample(humans, count):
-                await echo(ctx, content=text, member=m)
+            logger.debug(await fan_out(
+                random.sample(humans, count),
+                lambda m, _: echo(ctx, content=text, member=m),
+                ordered=False))
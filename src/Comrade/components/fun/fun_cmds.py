@@ -20,8 +20,10 @@ from PIL import Image, ImageDraw, ImageFont
 from utils.emoji_converter import emojiToText, textToEmoji
 from utils.echo import echo, mimic
 from utils.utilities import webscrape_header
+from utils.outbound import outbound
 
 from utils.logger import logger
+from client import message_stage, MessageContext, prefix, exact
 
 # Static dependencies
 with open("static/space.txt", "r", encoding="utf-8") as f:
@@ -243,33 +245,37 @@ class Fun(commands.Cog):
             for i in range(int(time)):
                 await asyncio.sleep(1)
                 t = i + 1
+                # not awaited; if edits fall behind, only the latest is sent
                 if t == 1:
-                    await announcement_msg.edit(content="1 second has passed", suppress=False)
+                    outbound.edit(announcement_msg, content="1 second has passed", suppress=False)
                 else:
-                    await announcement_msg.edit(content=f"{t} seconds have passed", suppress=False)
+                    outbound.edit(announcement_msg, content=f"{t} seconds have passed", suppress=False)
         else:
             await asyncio.sleep(int(time) - 2 if int(time) >= 2 else 0)
 
         # Restore original permissions
         await ctx.channel.set_permissions(ctx.guild.default_role, overwrite=current_permissions)
 
-        await announcement_msg.edit(content=f"*Time has begun to move again.*\n(Time stopped by {ctx.author.mention})", suppress=False)
+        # merged with any count still waiting, so that it is not overwritten
+        await outbound.edit(announcement_msg, content=f"*Time has begun to move again.*\n(Time stopped by {ctx.author.mention})", suppress=False)
 
         logger.info(f"Timestop in {ctx.channel.id} lasting {time} seconds sent by {ctx.author.id}")
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    @message_stage(60, triggers=[prefix("tte", "ett", ignore_case=True),
+                                 exact("STAR PLATINUM")])
+    async def emoji_listener(self, mc: MessageContext):
         '''
         Emoji call listener
         '''
+        message = mc.message
         if not message.author.bot:
             if message.content.lower()[0:3] == "tte":
-                await self.textToEmoji(await self.bot.get_context(message), text=message.content.lower().lstrip("tte "))
+                await self.textToEmoji(mc.ctx, text=message.content.lower().lstrip("tte "))
             elif message.content.lower()[0:3] == "ett":
-                await self.emojiToText(await self.bot.get_context(message), text=message.content.lower().lstrip("ett "))
+                await self.emojiToText(mc.ctx, text=message.content.lower().lstrip("ett "))
 
             if message.guild and message.content == "STAR PLATINUM":
-                await self.timestop(await self.bot.get_context(message), 5)
+                await self.timestop(mc.ctx, 5)
 
     @commands.command()
     async def defaultdance(self, ctx: commands.Context):
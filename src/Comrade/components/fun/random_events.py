@@ -4,9 +4,10 @@ from discord.ext import commands
 import random
 import asyncio
 
-from utils.utilities import role, ufil
+from utils.utilities import role
 from utils.checks import isOP
-from db import collection, RELAY_ID
+from db import user_profile, update_user_profile
+from client import message_stage, MessageContext
 
 
 class RandomEvents(commands.Cog):
@@ -35,8 +36,8 @@ class RandomEvents(commands.Cog):
             await ctx.send("Nameswap aborted (120s timeout).")
             return
 
-        collection("users").update_one(
-                    ufil(ctx.author),
+        await update_user_profile(
+                    ctx.author,
                     {"$set": {
                         "persistent-name":
                         msg.content[:32]}})
@@ -69,28 +70,24 @@ class RandomEvents(commands.Cog):
         await ctx.author.edit(roles=roles)
         await ctx.send(f"{ctx.author.mention} got rick roled.")
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    @message_stage(40)
+    async def random_event(self, mc: MessageContext):
 
-        if message.guild and message.guild.id != RELAY_ID and \
-                collection("servers").find_one(message.guild.id)["jokes"]:
+        if mc.server and mc.server["jokes"]:
             choice = random.choices(
                 *zip(*RandomEvents.probabilities.items()))[0]
 
-            if choice != "nothing":
-                ctx = await self.bot.get_context(message)
-
-                if choice == "nameswap":
-                    await self.nameswap(ctx)
-                elif choice == "rickroll":
-                    await self.rickroll(ctx)
+            if choice == "nameswap":
+                await self.nameswap(mc.ctx)
+            elif choice == "rickroll":
+                await self.rickroll(mc.ctx)
 
     @commands.Cog.listener()
     async def on_member_update(self,
                                before: discord.Member, after: discord.Member):
         if before.nick != after.nick:
 
-            userdoc = collection("users").find_one(ufil(after))
+            userdoc = await user_profile(after)
 
             if "persistent-name" not in userdoc:
                 return
@@ -102,8 +99,8 @@ class RandomEvents(commands.Cog):
         '''
         Clears name lock on a user who got nameswapped
         '''
-        collection("users").update_one(
-                    ufil(member),
+        await update_user_profile(
+                    member,
                     {"$unset": {
                         "persistent-name": ""}})
 
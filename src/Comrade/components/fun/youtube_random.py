@@ -1,10 +1,11 @@
-import discord
 from discord.ext import commands
 from pyyoutube import Api
 import os
 import random
 from collections import defaultdict
 
+from client import message_stage, MessageContext, exact
+
 SIPS_CHANNEL_ID = "UCD4INvKvy83OXwAkRjaQKtw"
 SIPS_PLAYLIST = "UUD4INvKvy83OXwAkRjaQKtw"
 
@@ -17,11 +18,12 @@ class Youtube(commands.Cog):
         self.pagetoken = None
         self.randompool = defaultdict(list)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    @message_stage(70, triggers=[exact("sips", ignore_case=True)])
+    async def sips(self, mc: MessageContext):
         '''
         Sends a sips video
         '''
+        message = mc.message
         if message.content.lower() == "sips":
             results = self.api.get_playlist_items(playlist_id=SIPS_PLAYLIST, parts="snippet", count=25, page_token=self.pagetoken)
 
@@ -9,10 +9,10 @@ import typing
 from .broken_picture_phone import BPCGame
 from .terrestrial import TerrestrialGame
 from utils.users import random_member_from_server
-from utils.utilities import bot_prefix, ufil
-from components.tools.text_gen import generate_text, text_model
+from utils.utilities import bot_prefix
+from components.tools.text_gen import text_model
 
-from db import collection
+from db import user_profile, update_user_profile
 
 
 class Games(commands.Cog):
@@ -252,12 +252,11 @@ class Games(commands.Cog):
 
                     await ctx.send(out)
 
-                    udict = collection("users").find_one(
-                        ufil(ctx.author))
+                    udict = await user_profile(ctx.author)
 
                     if self.streak[ctx.author.id] > udict["guessing-game"]["highest-streak"]:
-                        collection("users").update_one(ufil(ctx.author),
-                                                       {"$set": {"guessing-game.highest-streak": self.streak[ctx.author.id]}})
+                        await update_user_profile(ctx.author,
+                                                  {"$set": {"guessing-game.highest-streak": self.streak[ctx.author.id]}})
 
                         await ctx.send(f"{ctx.author.mention} has achieved a new high score: {self.streak[ctx.author.id]}")
 
@@ -300,7 +299,7 @@ class Games(commands.Cog):
                     model = await text_model(ctx.channel.id, luckyperson.id)
                     await m.delete()
 
-                    txt = generate_text(model)
+                    txt = model.generate(200)
 
                 self.activeGuess = luckyperson.display_name
                 await ctx.send(f'Who could have typed this? Submit your guess using `{bot_prefix}guess <your guess>`\n```{txt}```')
@@ -312,8 +311,8 @@ class Games(commands.Cog):
         '''
         Stats for guess
         '''
-        highscore = collection("users").find_one(
-            ufil(ctx.author))["guessing-game"]["highest-streak"]
+        highscore = (await user_profile(
+            ctx.author))["guessing-game"]["highest-streak"]
         currscore = self.streak[ctx.author.id]
 
         await ctx.send(f"**Info for {ctx.author.display_name}**\nCurrent Streak: {currscore}\nHighest Streak: {highscore}")
@@ -5,17 +5,19 @@ from discord_slash.utils.manage_commands import create_option
 
 import datetime
 
-from utils.echo import echo
+from utils.echo import echo, webhooks
+from utils.outbound import outbound
 
 from collections import defaultdict
 
-from utils.utilities import (get_uptime, get_host,
+from utils.utilities import (get_uptime, get_host, get_loop_lag,
                              local_time, utc_to_local_time, bot_prefix)
 
 from utils.checks import isNotThreat
 import math
 
 from config import cfg, version
+from client import pipeline
 import sys
 
 GUILD_IDS = [709954286376976425, 419214713252216848]
@@ -38,11 +40,17 @@ class General(commands.Cog):
         '''
         Shows the current status of the bot
         '''
+        mean_lag, max_lag = get_loop_lag()
         await ctx.send(f"**Uptime**: {round(get_uptime(), 1)}s\n"
                        f"**Version**: {version}\n"
                        f"Currently Connected to **{len(self.bot.guilds)}** "
                        f"server(s)\n**Host**: {get_host()}\n"
                        f"**API Latency**: {round(self.bot.latency, 4)}s\n"
+                       f"**Event Loop Lag**: {round(mean_lag, 2)} ms "
+                       f"(max {round(max_lag, 2)} ms)\n"
+                       f"**Message Pipeline**: {pipeline.info()}\n"
+                       f"**Webhooks**: {webhooks.info()}\n"
+                       f"**Outbound**: {outbound.info()}\n"
                        f"Running discord.py version {discord.__version__}")
 
     @cog_ext.cog_slash(name="dm",
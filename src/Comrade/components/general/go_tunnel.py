@@ -1,9 +1,9 @@
 # Tunnel to talk with Go Bot
-import discord
 from discord.ext import commands
 
 from utils.logger import logger
 from db import relay_channel
+from client import message_stage, MessageContext, prefix
 
 
 class Go(commands.Cog):
@@ -13,8 +13,9 @@ class Go(commands.Cog):
     def __init__(self, bot):
         self.bot: commands.Bot = bot
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    @message_stage(80, triggers=[prefix("<%PY>")])
+    async def relay_listener(self, mc: MessageContext):
+        message = mc.message
         if message.channel == relay_channel() and message.content.startswith("<%PY>"):
             logger.info(f"Relay message: {message.content[5:]}")
 
@@ -9,17 +9,41 @@ from random import choice
 import async_timeout
 from discord.ext.commands.view import StringView
 
-from db import collection
+from db import (collection, async_collection,
+                user_profile, drop_user_profiles)
 from utils.reactions import reactOK
 from utils.users import random_member_from_server
 from utils.checks import isNotThreat
 from utils.utilities import bot_prefix
 from config import cfg
-from client import client as bot
+from client import (client as bot, message_stage, MessageContext,
+                    contains, exact)
 
 
 MACRO_TIMEOUT = int(cfg["Performance"]["macro-timeout"])
 
+# guild id -> names of the macros in that server
+macro_names: dict = {}
+
+
+async def server_macros(guild_id: int) -> set:
+    '''
+    Returns the names of all macros in a server, loading them once
+    '''
+    if (names := macro_names.get(guild_id)) is None:
+        names = macro_names[guild_id] = {
+            m["name"] for m in await async_collection("macros").find(
+                {"server": guild_id}, {"name": True})}
+    return names
+
+
+def is_macro_call(names: set, content: str) -> bool:
+    '''
+    Whether a message would be matched by process_macro
+    '''
+    return content in names or content.lower() in names or (
+        bool(args := content.split()) and args[0] in names)
+
 
 async def process_macro(message: discord.message):
     '''
@@ -28,20 +52,21 @@ async def process_macro(message: discord.message):
     if message.author.bot or not message.content:
         return
 
-    macros = collection("macros")
+    macros = async_collection("macros")
 
     # Check if user has opted in
-    if not collection("users").find_one({"user": message.author.id, "macros": True}):
+    if not (profile := await user_profile(message.author)) or \
+            not profile.get("macros"):
         return
 
     # First, try fast loop for simple macros
-    cmds = macros.find_one(
+    cmds = await macros.find_one(
         {"server": message.guild.id, "name": message.content})
     args = []
 
     # Try lowercase as well
     if not cmds:
-        cmds = macros.find_one(
+        cmds = await macros.find_one(
             {"server": message.guild.id, "name": message.content.lower()})
 
     if not cmds:
@@ -49,7 +74,7 @@ async def process_macro(message: discord.message):
         args = message.content.split()
         name = args.pop(0)
 
-        cmds = macros.find_one(
+        cmds = await macros.find_one(
             {"server": message.guild.id, "name": name})
         # only macros with arguments in them
 
@@ -149,13 +174,24 @@ class Macros(commands.Cog):
     def __init__(self, bot):
         self.bot: commands.Bot = bot
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.message):
+    @message_stage(30)
+    async def macro_listener(self, mc: MessageContext):
+        '''
+        Runs macros; names are checked in memory before going to the database
+        '''
+        if mc.user and mc.user.get("macros") and mc.message.content and \
+                is_macro_call(await server_macros(mc.message.guild.id),
+                              mc.message.content):
+            await process_macro(mc.message)
+
+    @message_stage(31, triggers=[contains("@someone", ignore_case=True),
+                                 exact("hello comrade", ignore_case=True)])
+    async def fun_listener(self, mc: MessageContext):
+        message = mc.message
         if not message.author.bot and message.guild:
-            await process_macro(message)
 
             # Fun features
-            if "@someone" in message.content.lower():
+            if "@someone" in mc.content:
                 e = discord.Embed(color=0xd7342a,
                     description=random_member_from_server(message.guild.id, True).mention)
                 e.set_footer(
@@ -249,6 +285,7 @@ class Macros(commands.Cog):
                  "macro": macro.strip("```").strip("\n"),
                  "author": ctx.author.id}
                 )
+        (await server_macros(ctx.guild.id)).add(name)
         await reactOK(ctx)
 
     @commands.command(aliases=["listmacros", "macrolist", "macros"])
@@ -276,6 +313,7 @@ class Macros(commands.Cog):
         '''
         collection("macros").delete_one(
             {"server": ctx.guild.id, "name": name})
+        (await server_macros(ctx.guild.id)).discard(name)
         await reactOK(ctx)
 
     @commands.command(aliases=["viewmacro"])
@@ -305,7 +343,8 @@ class Macros(commands.Cog):
         '''
         Opts in to macros
         '''
-        collection("users").update_one({"user": ctx.author.id}, {"$set": {"macros": True}})
+        collection("users").update_many({"user": ctx.author.id}, {"$set": {"macros": True}})
+        drop_user_profiles(user=ctx.author.id)
         await ctx.message.add_reaction("👍")
 
     @commands.command()
@@ -314,5 +353,6 @@ class Macros(commands.Cog):
         '''
         Opts out from macros
         '''
-        collection("users").update_one({"user": ctx.author.id}, {"$set": {"macros": False}})
+        collection("users").update_many({"user": ctx.author.id}, {"$set": {"macros": False}})
+        drop_user_profiles(user=ctx.author.id)
         await ctx.message.add_reaction("👍")
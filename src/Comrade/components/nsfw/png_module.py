@@ -152,8 +152,7 @@ class PNGS(commands.Cog):
         e.set_footer(text=" ".join(list1))
 
 
-        channel_id = collection(
-            "servers").find_one(message.guild.id)["channels"]["pngs"]
+        channel_id = server_cfg(message.guild.id)["channels"]["pngs"]
         pngchn = message.guild.get_channel(channel_id)
         await pngchn.send(embed=e)
 
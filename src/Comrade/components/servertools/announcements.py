@@ -4,13 +4,13 @@ Comrade - Timed announcements
 import discord
 from discord.ext import commands, tasks
 
-from utils.utilities import local_time, ufil, role
+from utils.utilities import local_time, role
 from utils.checks import isServerOwner, isNotThreat
 from utils.reactions import reactOK
 from utils.users import (weighted_member_from_server,
                          rebuild_weight_table, sum_of_weights)
 from utils.logger import logger
-from db import collection, emote_channel
+from db import collection, server_cfg, update_user_profile, emote_channel
 from utils.echo import echo
 import io
 
@@ -43,8 +43,8 @@ class Announcements(commands.Cog):
         if luckyperson := channel.guild.get_member(
                 await weighted_member_from_server(channel.guild)):
 
-            collection("users").update_one(
-                ufil(luckyperson),
+            await update_user_profile(
+                luckyperson,
                 {"$inc": {"daily-weight": -1}})
 
             dailyrole = await role(channel.guild, "Member of the Day")
@@ -93,13 +93,12 @@ class Announcements(commands.Cog):
         '''
         Makes an announcement
         '''
-        servers = collection("servers").find()
-
         now = local_time()
 
-        for s in servers:
+        for guild_id in self.announcements:
             try:
-                for a in self.announcements[s["_id"]]:
+                s = server_cfg(guild_id)
+                for a in self.announcements[guild_id]:
 
                     if (now.strftime("%H:%M") == a["time"]):
                         c = self.bot.get_channel(
@@ -168,8 +167,7 @@ class Announcements(commands.Cog):
 
             if (time == a["time"]):
                 c = ctx.guild.get_channel(
-                    collection("servers").find_one(
-                        ctx.guild.id)["channels"]["announcements"])
+                    server_cfg(ctx.guild.id)["channels"]["announcements"])
 
                 if hasattr(a["announcement"], "__call__"):
                     await a["announcement"](c)  # daily announce
@@ -4,11 +4,14 @@ from discord.ext import commands
 from ast import literal_eval
 import typing
 
-from db import collection
+from db import (collection, server_cfg, update_server_cfg,
+                cache_server_cfg, drop_server_cfg,
+                update_user_profile, drop_user_profiles, profile_cache)
+from db.cache import server_cfgs
 from utils.checks import isServerOwner
 from utils.reactions import reactOK, reactX
-from utils.utilities import ufil
 from utils.databases import new_server, rebuild_user_profiles
+from utils.blob_cache import emote_cache
 
 
 class Databases(commands.Cog):
@@ -37,13 +40,13 @@ class Databases(commands.Cog):
 
         try:
             if channel:
-                collection("servers").update_one(
-                    {"_id": ctx.guild.id},
+                await update_server_cfg(
+                    ctx.guild.id,
                     {"$set": {f"channels.{channel_name}": channel.id}})
 
             else:
-                collection("servers").update_one(
-                    {"_id": ctx.guild.id},
+                await update_server_cfg(
+                    ctx.guild.id,
                     {"$set": {f"channels.{channel_name}": 0}})
         except Exception as ex:
             await ctx.send(f"Error: {ex}")
@@ -58,13 +61,12 @@ class Databases(commands.Cog):
         '''
         View database channel mappings
         '''
-        server_cfg = collection("servers").find_one({"_id": ctx.guild.id})
+        channels = server_cfg(ctx.guild.id)["channels"]
 
         s = ""
 
-        for channel_name in server_cfg["channels"]:
-            if channel := self.bot.get_channel(
-                    server_cfg["channels"][channel_name]):
+        for channel_name in channels:
+            if channel := self.bot.get_channel(channels[channel_name]):
                 s += f"{channel_name}: {channel.mention}\n"
             else:
                 s += f"{channel_name}: Unassigned\n"
@@ -97,8 +99,8 @@ class Databases(commands.Cog):
 
         if value is None:
             try:
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$unset": {index: ""}}
                 )
             except Exception as ex:
@@ -106,8 +108,8 @@ class Databases(commands.Cog):
 
         else:
             try:
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$set": {index: literal_eval(value)}}
                 )
             except Exception as ex:
@@ -146,6 +148,7 @@ class Databases(commands.Cog):
             except Exception as ex:
                 await ctx.send(f"Error: {ex}")
 
+        drop_user_profiles(server=ctx.guild.id)
         await reactOK(ctx)
 
     @configure.command()
@@ -163,8 +166,8 @@ class Databases(commands.Cog):
 
         if value is None:
             try:
-                collection("servers").update_one(
-                    {"_id": ctx.guild.id},
+                await update_server_cfg(
+                    ctx.guild.id,
                     {"$unset": {index: ""}}
                 )
             except Exception as ex:
@@ -172,8 +175,8 @@ class Databases(commands.Cog):
 
         else:
             try:
-                collection("servers").update_one(
-                    {"_id": ctx.guild.id},
+                await update_server_cfg(
+                    ctx.guild.id,
                     {"$set": {index: literal_eval(value)}}
                 )
             except Exception as ex:
@@ -181,13 +184,25 @@ class Databases(commands.Cog):
 
         await reactOK(ctx)
 
+    @commands.command()
+    @commands.is_owner()
+    async def dbcache(self, ctx: commands.Context):
+        '''
+        Shows status of the database caches
+        '''
+        await ctx.send(f"Server configurations cached: {len(server_cfgs)}\n"
+                       f"{profile_cache.info()}\n"
+                       f"{emote_cache.info()}")
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
         '''
         When the bot joins a server.
         '''
-        collection("servers").insert_one(new_server(guild))
-        rebuild_user_profiles(guild)
+        document = new_server(guild)
+        collection("servers").insert_one(document)
+        cache_server_cfg(document)
+        await rebuild_user_profiles(guild)
         # Add new server entry
 
     @commands.Cog.listener()
@@ -196,5 +211,7 @@ class Databases(commands.Cog):
         When the bot leaves a server.
         '''
         collection("servers").delete_one({"_id": guild.id})
+        drop_server_cfg(guild.id)
         collection("users").delete_many({"server": guild.id})
+        drop_user_profiles(server=guild.id)
         # I've been kicked etc
@@ -0,0 +1,161 @@
+'''
+Image processing for emotes, run in worker processes
+so that large images do not block the event loop.
+Each image is decoded once, and also shrunk to fit as an inline emoji
+(Discord limits emoji to 256 kb) when it is too large.
+Images get a perceptual hash, which is close for images that look the same.
+'''
+import io
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageSequence
+
+from config import cfg
+
+INLINE_LIMIT = 262143
+# largest file Discord accepts as an emoji, in bytes
+INLINE_SIDES = [128, 96, 64, 48, 32]
+# emoji are displayed at most 128 px wide, so there is no point being larger
+INLINE_COLOURS = [256, 128, 64, 32]
+
+FORMATS = {"PNG": "png", "JPEG": "jpeg", "GIF": "gif", "WEBP": "webp"}
+
+HASH_SIZE = 8
+# the hash compares 8x8 pixels, for 64 bits
+HASH_BANDS = 4
+DUPLICATE_DISTANCE = HASH_BANDS - 1
+# images are duplicates if their hashes differ in at most this many bits,
+# so that duplicates always have one band of their hash in common
+
+WORKERS = int(cfg["Performance"].get("image-workers", "2"))
+
+executor = None
+
+
+def perceptual_hash(im: Image.Image) -> str:
+    '''
+    Difference hash of an image: whether each pixel of a small, grayscale
+    version is brighter than the next, as hex digits.
+    Resized or recompressed copies of an image get the same or close hashes.
+    '''
+    frame = im.convert("RGBA")
+    background = Image.new("RGBA", frame.size, (255, 255, 255, 255))
+    background.alpha_composite(frame)
+    # transparent pixels count as white, whatever colour they hide
+
+    pixels = list(background.convert("L").resize(
+        (HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            i = row * (HASH_SIZE + 1) + col
+            bits = bits << 1 | (pixels[i] > pixels[i + 1])
+    return f"{bits:0{HASH_SIZE ** 2 // 4}x}"
+
+
+def hash_bands(phash: str) -> list:
+    '''
+    Parts of a perceptual hash, numbered so that
+    they only match the same part of another hash
+    '''
+    width = len(phash) // HASH_BANDS
+    return [band << 4 * width | int(phash[band * width:(band + 1) * width], 16)
+            for band in range(HASH_BANDS)]
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def encode(frames: list, durations: list, loop: int, image_format: str,
+           side: int, colours: int) -> bytes:
+    '''
+    Encodes frames shrunk to fit in a square of a size, and,
+    if they are animated, reduced to a number of colours
+    '''
+    resized = []
+    for frame in frames:
+        frame = frame.copy()
+        frame.thumbnail((side, side), Image.LANCZOS)
+        if len(frames) > 1:
+            frame = frame.quantize(colours, method=Image.FASTOCTREE)
+        resized.append(frame)
+
+    buffer = io.BytesIO()
+    if len(resized) > 1:
+        resized[0].save(buffer, "GIF", save_all=True,
+                        append_images=resized[1:], duration=durations,
+                        loop=loop, disposal=2, optimize=True)
+    elif image_format == "JPEG":
+        resized[0].convert("RGB").save(buffer, "JPEG", quality=90)
+    else:
+        resized[0].save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def process_image(data: bytes) -> dict:
+    '''
+    Decodes and validates an image, returning its file extension,
+    dimensions, perceptual hash, whether it fits as an inline emoji as is,
+    and otherwise a shrunk version of it which does
+    (None if it cannot be made small enough).
+    Runs in a worker process.
+    '''
+    try:
+        im = Image.open(io.BytesIO(data))
+        im.load()
+    except Exception:
+        raise TypeError("Could not download emote. Check that you are "
+                        "actually linking to an image or GIF.")
+
+    if im.format not in FORMATS:
+        raise TypeError(f"Images of type {im.format} are not supported.")
+
+    result = {"ext": FORMATS[im.format], "width": im.width,
+              "height": im.height, "phash": perceptual_hash(im),
+              "fits": len(data) <= INLINE_LIMIT and im.format != "WEBP",
+              "inline": None, "inline-ext": None}
+
+    if result["fits"]:
+        return result
+
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(im):
+        durations.append(frame.info.get("duration", 100))
+        frames.append(frame.convert("RGBA"))
+    loop = im.info.get("loop", 0)
+    result["inline-ext"] = "gif" if len(frames) > 1 else \
+        "jpeg" if im.format == "JPEG" else "png"
+
+    # try to keep as much detail as possible, shrinking further each time
+    for side in INLINE_SIDES:
+        for colours in INLINE_COLOURS if len(frames) > 1 else [256]:
+            content = encode(frames, durations, loop, im.format,
+                             side, colours)
+            if len(content) <= INLINE_LIMIT:
+                result["inline"] = content
+                return result
+
+    if len(frames) > 1:
+        # too many frames: keep every other one, at the same speed
+        frames = frames[::2]
+        durations = [a + b for a, b in zip(
+            durations[::2], durations[1::2] + [0])]
+        content = encode(frames, durations, loop, im.format,
+                         INLINE_SIDES[-1], INLINE_COLOURS[-1])
+        if len(content) <= INLINE_LIMIT:
+            result["inline"] = content
+
+    return result
+
+
+async def process(data: bytes) -> dict:
+    '''
+    Processes an image in the worker pool
+    '''
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=WORKERS)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, process_image, data)
@@ -0,0 +1,177 @@
+'''
+In-memory index of the emote names in each server,
+so that emotes can be resolved by name without scanning the database.
+Documents store their name in lowercase as well ("lowercase-name"),
+making case-insensitive database lookups indexed equality matches.
+'''
+import time
+
+from pymongo import UpdateOne
+
+from db import async_collection
+
+MISS_TTL = 60.0
+# seconds a name is known not to be an emote, in case another process adds it
+MISS_LIMIT = 10000
+# names known not to be emotes, per server
+
+
+class EmoteIndex:
+    '''
+    Names of the emotes in one server: exact and case-folded lookups,
+    and a trie of lowercase names for prefix suggestions
+    '''
+    def __init__(self, names=()):
+        self.names = set()
+        self.folded = {}  # lowercase name -> names, in order of addition
+        self.trie = {}  # character -> node; None -> names ending there
+        self.misses = {}
+        # lowercase name -> when it was not found in the database, oldest first
+
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str):
+        if name in self.names:
+            return
+        self.names.add(name)
+        self.folded.setdefault(name.lower(), []).append(name)
+        self.misses.pop(name.lower(), None)
+
+        node = self.trie
+        for c in name.lower():
+            node = node.setdefault(c, {})
+        node.setdefault(None, set()).add(name)
+
+    def remove(self, name: str):
+        if name not in self.names:
+            return
+        self.names.discard(name)
+
+        folded = self.folded[name.lower()]
+        folded.remove(name)
+        if not folded:
+            del self.folded[name.lower()]
+
+        node = self.trie
+        for c in name.lower():
+            node = node[c]
+        node[None].discard(name)
+
+    def rename(self, old: str, new: str):
+        self.remove(old)
+        self.add(new)
+
+    def resolve(self, name: str) -> str:
+        '''
+        Returns the name of the emote matching a name exactly,
+        or else ignoring case (maybe they just can't spell)
+        '''
+        if name in self.names:
+            return name
+        if folded := self.folded.get(name.lower()):
+            return folded[0]
+        return None
+
+    def missed(self, name: str) -> bool:
+        '''
+        Whether a name was recently not found in the database
+        '''
+        return (when := self.misses.get(name.lower())) is not None and \
+            time.monotonic() - when < MISS_TTL
+
+    def miss(self, names):
+        '''
+        Records lowercase names which were not found in the database,
+        so that chat which merely looks like emotes is not looked up again
+        '''
+        now = time.monotonic()
+        for name in names:
+            self.misses.pop(name, None)
+            self.misses[name] = now
+        while len(self.misses) > MISS_LIMIT:
+            del self.misses[next(iter(self.misses))]
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        '''
+        Names of emotes starting with a prefix (ignoring case),
+        in alphabetical order
+        '''
+        node = self.trie
+        for c in prefix.lower():
+            if (node := node.get(c)) is None:
+                return []
+
+        found = []
+        stack = [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            found.extend(sorted(node.get(None, ())))
+            stack.extend(node[c] for c in sorted(
+                (c for c in node if c is not None), reverse=True))
+        return found[:limit]
+
+
+# guild id -> EmoteIndex
+emote_indexes: dict = {}
+
+
+async def emote_index(guild_id: int) -> EmoteIndex:
+    '''
+    Returns the emote index of a server, loading it on first use.
+    Also fills in the lowercase name of documents which predate it.
+    '''
+    if (index := emote_indexes.get(guild_id)) is None:
+        documents = await async_collection("emotes").find(
+            {"server": guild_id}, {"name": True, "lowercase-name": True})
+
+        if updates := [
+                UpdateOne({"_id": d["_id"]},
+                          {"$set": {"lowercase-name": d["name"].lower()}})
+                for d in documents if "lowercase-name" not in d]:
+            await async_collection("emotes").bulk_write(updates, ordered=False)
+
+        # another task may have loaded it while we were waiting
+        index = emote_indexes.setdefault(
+            guild_id, EmoteIndex(d["name"] for d in documents))
+    return index
+
+
+async def find_emotes(guild_id: int, names) -> dict:
+    '''
+    Finds the documents of several emotes by name at once,
+    ignoring case for names without an exact match.
+    Returns name -> document, leaving out emotes which were not found.
+    '''
+    index = await emote_index(guild_id)
+    emotes = async_collection("emotes")
+
+    resolved = {name: index.resolve(name) for name in names}
+    documents = {}
+
+    if known := {r for r in resolved.values() if r}:
+        documents = {d["name"]: d for d in await emotes.find(
+            {"server": guild_id, "name": {"$in": list(known)}})}
+
+        for name in known - documents.keys():
+            index.remove(name)  # removed by another process
+
+    # not known to this process, nor recently looked up in vain
+    if unknown := {name.lower() for name, r in resolved.items()
+                   if r not in documents and not index.missed(name)}:
+        for d in await emotes.find({"server": guild_id,
+                                    "lowercase-name": {"$in": list(unknown)}}):
+            index.add(d["name"])
+            documents.setdefault(d["name"], d)
+        index.miss(unknown - {name.lower() for name in documents})
+
+    return {name: documents[r] for name in resolved
+            if (r := index.resolve(name)) in documents}
+
+
+async def find_emote(guild_id: int, name: str) -> dict:
+    '''
+    Finds the document of an emote by name,
+    ignoring case if there is no exact match
+    '''
+    return (await find_emotes(guild_id, [name])).get(name)
@@ -0,0 +1,147 @@
+'''
+Emoji slots of each server, used by inline emote injection.
+Tracks how much each emote is used, so that the least valuable emoji
+is unloaded when a server runs out of slots, rather than the oldest one.
+'''
+import time
+
+from pymongo import UpdateOne
+
+from config import cfg
+from db import async_collection
+
+HALF_LIFE = float(cfg["Performance"].get("emote-usage-half-life", "604800"))
+# seconds it takes for the weight of a past use to halve
+
+
+class SlotManager:
+    '''
+    Usage of the emotes in one server.
+    Each emote has a usage score which gains 1 per use and decays
+    exponentially, combining recency (LRU) and frequency (LFU).
+    Pinned emotes are never unloaded.
+    '''
+    def __init__(self, guild_id: int, documents=()):
+        self.guild_id = guild_id
+        self.usage = {}  # name -> (score, time of last use)
+        self.pinned = set()
+
+        self.pending = {}  # name -> uses not yet written to the database
+        self.unloading = set()  # ids of emoji being deleted
+        self.created = set()  # ids of new emoji the cache may not have yet
+
+        self.hits = 0  # inline emotes which were already loaded
+        self.misses = 0  # inline emotes which had to be injected
+
+        for d in documents:
+            if "usage" in d:
+                self.usage[d["name"]] = (d["usage"], d["last-used"])
+            if d.get("pinned"):
+                self.pinned.add(d["name"])
+
+    def score(self, name: str, now: float = None) -> float:
+        if (entry := self.usage.get(name)) is None:
+            return 0
+        score, last_used = entry
+        return score * 0.5 ** (((now or time.time()) - last_used) / HALF_LIFE)
+
+    def record_use(self, name: str):
+        now = time.time()
+        self.usage[name] = (self.score(name, now) + 1, now)
+        self.pending[name] = self.pending.get(name, 0) + 1
+
+    def rename(self, old: str, new: str):
+        for d in (self.usage, self.pending):
+            if old in d:
+                d[new] = d.pop(old)
+        if old in self.pinned:
+            self.pinned.discard(old)
+            self.pinned.add(new)
+
+    def loaded(self, emojis: list) -> list:
+        '''
+        Emoji occupying slots, accounting for deletions and creations
+        which the guild cache may not reflect yet
+        '''
+        ids = {e.id for e in emojis}
+        self.unloading &= ids
+        self.created -= ids
+        return [e for e in emojis if e.id not in self.unloading]
+
+    def occupied(self, emojis: list) -> int:
+        return len(self.loaded(emojis)) + len(self.created)
+
+    def choose_unload(self, emojis: list):
+        '''
+        Returns the emoji to unload to make space, or None if all are pinned.
+        Ties (eg. emoji never used through Comrade) go to the oldest one.
+        '''
+        now = time.time()
+        candidates = [e for e in self.loaded(emojis)
+                      if e.name not in self.pinned]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: self.score(e.name, now))
+
+    def updates(self) -> list:
+        '''
+        Database writes for the uses recorded since the last call
+        '''
+        updates = [
+            UpdateOne({"server": self.guild_id, "name": name},
+                      {"$inc": {"uses": uses},
+                       "$set": {"usage": self.usage[name][0],
+                                "last-used": self.usage[name][1]}})
+            for name, uses in self.pending.items() if name in self.usage]
+        self.pending.clear()
+        return updates
+
+    def info(self, emojis: list) -> str:
+        total = self.hits + self.misses
+        top = sorted(self.usage, key=self.score, reverse=True)[:5]
+        return (f"Slots used: {self.occupied(emojis)}\n"
+                f"Pinned: {', '.join(sorted(self.pinned)) or 'none'}\n"
+                f"Hit rate: {round(self.hits / total * 100, 1) if total else 0}% "
+                f"({self.hits} loaded, {self.misses} injected)\n"
+                f"Most used: {', '.join(top) or 'none'}")
+
+
+# guild id -> SlotManager
+slot_managers: dict = {}
+
+
+async def slot_manager(guild_id: int) -> SlotManager:
+    '''
+    Returns the slot manager of a server, loading usage on first use
+    '''
+    if (manager := slot_managers.get(guild_id)) is None:
+        documents = await async_collection("emotes").find(
+            {"server": guild_id, "$or": [{"usage": {"$exists": True}},
+                                         {"pinned": True}]},
+            {"name": True, "usage": True, "last-used": True, "pinned": True})
+
+        # another task may have loaded it while we were waiting
+        manager = slot_managers.setdefault(
+            guild_id, SlotManager(guild_id, documents))
+    return manager
+
+
+async def flush_usage():
+    '''
+    Writes the emote uses recorded in memory to the database
+    '''
+    if updates := [u for manager in slot_managers.values()
+                   for u in manager.updates()]:
+        await async_collection("emotes").bulk_write(updates, ordered=False)
+
+
+async def record_uses(guild_id: int, names, injected: int = 0):
+    '''
+    Records the use of inline emotes,
+    of which a number had to be injected first
+    '''
+    manager = await slot_manager(guild_id)
+    for name in names:
+        manager.record_use(name)
+    manager.hits += len(names) - injected
+    manager.misses += injected
@@ -7,121 +7,493 @@ Developed by itchono and Slyflare
 With testing from the rest of the Comrade team
 '''
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+from pymongo import UpdateOne
 
-import imghdr
 import re
 import io
+import os
+import time
+import asyncio
 import aiohttp
-from PIL import Image
+import zipfile
+from collections import defaultdict, namedtuple
+from urllib.parse import urlparse
 from typing import Optional
 
-from db import collection, emote_channel
+from config import cfg
+from db import collection, async_collection, emote_channel
 from utils.utilities import is_url, bot_prefix
 from utils.reactions import reactX
 from utils.echo import echo, mimic
 from utils.checks import isOP
 from utils.button_menu import send_menu
+from utils.logger import logger
+from utils.outbound import outbound
+from utils.blob_cache import emote_cache
+from client import message_stage, MessageContext, pattern
+from .emote_index import emote_index, find_emote, find_emotes
+from .emote_slots import slot_manager, record_uses, flush_usage
+from .emote_images import (process, hash_bands, hamming, INLINE_LIMIT,
+                           DUPLICATE_DISTANCE)
 
 session = aiohttp.ClientSession()
 
+slot_locks = defaultdict(asyncio.Lock)
+# guild id -> lock, so that injections do not unload the same emoji
 
-async def upload(ctx, name, url, emote_type="auto") -> str:
-    '''
-    Uploads an emote into CES provided a name and a url.
-    '''
-    async with session.get(url) as resp:
-        content = await resp.read()
+INLINE_EMOTE = r"(?<!<)(?<!a):\s*[0-9A-z]+\s*:(?!\d+>)"
+# :emote: in a message, which is not already a rendered emoji
+SWAP_EMOTE = r"\A\\(?s:.*)\\\Z"
+# \emote\ swaps the type of an emote
 
-    ext = imghdr.what(None, h=content)
-    # determine the file extension
+IMPORT_CONCURRENCY = int(
+    cfg["Performance"].get("emote-import-concurrency", "4"))
+# images downloaded and processed at the same time by a bulk import
+IMPORT_LIMIT = int(cfg["Performance"].get("emote-import-limit", "500"))
+# maximum number of emotes in a bulk import
 
-    content = io.BytesIO(content)
+RELAY_FILES = 10
+RELAY_BYTES = 8 * 2**20
+# attachments, and their total size, allowed in one relay message
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+ZIP_BYTES = 64 * 2**20
+# most image data read from a zip file
 
-    channel = emote_channel(ctx.guild)
+LIST_PAGE_SIZE = 10
+# emote names on each page of emote list
+
+PreparedEmote = namedtuple(
+    "PreparedEmote", ["name", "type", "image", "digest", "files", "size"])
 
-    if ext is None:
-        raise TypeError(
-            "Could not download emote. Check that you are actually linking to an image or GIF.")
+
+async def prepare(name: str, content: bytes, emote_type="auto") -> tuple:
+    '''
+    Processes an image for upload, returning the type of the emote,
+    information about the image and the files to store in the relay channel.
+    Images too large to be inline emoji are also stored shrunk,
+    so that they can become inline later.
+    '''
+    image = await process(content)
+    # decode, validate and shrink off of the event loop
 
     if emote_type == "auto":
         # Automatically make inline
-        im = Image.open(content)
+        emote_type = "inline" if max(image["width"], image["height"]) < 256 \
+            and (image["fits"] or image["inline"]) else "big"
 
-        content.seek(0)
+    elif emote_type == "inline" and not (image["fits"] or image["inline"]):
+        raise TypeError("Emote is too big to be inline, "
+                        "even after shrinking it.")
 
-        emote_type = "inline" if max(im.size) < 256 else "big"
+    files = [discord.File(io.BytesIO(content),
+                          filename=f"{name}.{image['ext']}")]
+    if image["inline"]:
+        files.append(discord.File(
+            io.BytesIO(image["inline"]),
+            filename=f"{name}_inline.{image['inline-ext']}"))
+        image["inline-hash"] = await emote_cache.put(image["inline"])
 
-    msg = await channel.send(
-        file=discord.File(content, filename=f"{name}.{ext}"))
+    return emote_type, image, files
 
-    collection("emotes").insert_one(
-        {"name": name,
-         "server": ctx.guild.id,
-         "type": emote_type,
-         "ext": ext,
-         "URL": msg.attachments[0].url,
-         "size": msg.attachments[0].size})
+
+def emote_document(guild_id: int, name: str, emote_type: str, image: dict,
+                   digest: str, attachments: list) -> dict:
+    '''
+    Database document of an emote uploaded to the relay channel
+    '''
+    document = {"name": name,
+                "lowercase-name": name.lower(),
+                "server": guild_id,
+                "type": emote_type,
+                "ext": image["ext"],
+                "URL": attachments[0].url,
+                "size": attachments[0].size,
+                "hash": digest,
+                "phash": image["phash"],
+                "phash-bands": hash_bands(image["phash"])}
+    if image["inline"]:
+        document["inline-URL"] = attachments[1].url
+        document["inline-hash"] = image["inline-hash"]
+    return document
+
+
+async def find_duplicates(guild_id: int, phash: str) -> list:
+    '''
+    Emotes in a server which look the same as an image, given its
+    perceptual hash. Only emotes sharing a band of the hash are compared.
+    '''
+    return [d for d in await async_collection("emotes").find(
+        {"server": guild_id, "phash-bands": {"$in": hash_bands(phash)}},
+        {"name": True, "phash": True})
+        if hamming(d["phash"], phash) <= DUPLICATE_DISTANCE]
+
+
+def duplicate_groups(documents: list) -> list:
+    '''
+    Groups of emotes which look the same,
+    pinned then most used first in each group
+    '''
+    parent = list(range(len(documents)))
+    # union-find over the documents
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    bands = defaultdict(list)  # band -> indexes of documents with it
+    for i, d in enumerate(documents):
+        if "phash" not in d:
+            continue
+        for band in hash_bands(d["phash"]):
+            for j in bands[band]:
+                if hamming(d["phash"], documents[j]["phash"]) <= \
+                        DUPLICATE_DISTANCE:
+                    parent[root(i)] = root(j)
+            bands[band].append(i)
+
+    groups = defaultdict(list)
+    for i, d in enumerate(documents):
+        if "phash" in d:
+            groups[root(i)].append(d)
+
+    return [sorted(group, key=lambda d: (not d.get("pinned"),
+                                         -d.get("uses", 0), d["name"]))
+            for group in groups.values() if len(group) > 1]
+
+
+async def hash_emotes(documents: list):
+    '''
+    Computes the perceptual hash of emotes uploaded before it existed
+    '''
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def hash_emote(document):
+        async with semaphore:
+            try:
+                content, _ = await emote_cache.fetch(
+                    session, document["URL"], document.get("hash"))
+                document["phash"] = (await process(content))["phash"]
+            except Exception as e:
+                logger.error(f"Could not hash emote {document['name']}",
+                             exc_info=e)
+                return None
+        return UpdateOne({"_id": document["_id"]},
+                         {"$set": {"phash": document["phash"],
+                                   "phash-bands": hash_bands(document["phash"])}})
+
+    if updates := [u for u in await asyncio.gather(
+            *(hash_emote(d) for d in documents)) if u]:
+        await async_collection("emotes").bulk_write(updates, ordered=False)
+
+
+async def upload(ctx, name, url, emote_type="auto",
+                 duplicates: bool = True) -> str:
+    '''
+    Uploads an emote into CES provided a name and a url.
+    Can refuse images which look the same as an emote in the server.
+    '''
+    content, digest = await emote_cache.fetch(session, url)
+
+    emote_type, image, files = await prepare(name, content, emote_type)
+
+    if not duplicates and (found := await find_duplicates(
+            ctx.guild.id, image["phash"])):
+        raise TypeError(f"Emote `{name}` looks the same as "
+                        f"`{found[0]['name']}`, which is already in the server.")
+
+    msg = await emote_channel(ctx.guild).send(files=files)
+
+    await async_collection("emotes").insert_one(emote_document(
+        ctx.guild.id, name, emote_type, image, digest, msg.attachments))
+    (await emote_index(ctx.guild.id)).add(name)
 
     return emote_type
 
 
-async def inject(ctx: commands.Context, name) -> discord.Emoji:
+async def upload_inline(ctx, document: dict) -> bool:
+    '''
+    Uploads a shrunk version of an emote too large to be inline,
+    returning whether it could be made small enough
+    '''
+    content, _ = await emote_cache.fetch(
+        session, document["URL"], document.get("hash"))
+
+    if not (inline := (image := await process(content))["inline"]):
+        return False
+
+    msg = await emote_channel(ctx.guild).send(file=discord.File(
+        io.BytesIO(inline),
+        filename=f"{document['name']}_inline.{image['inline-ext']}"))
+
+    document["inline-URL"] = msg.attachments[0].url
+    document["inline-hash"] = await emote_cache.put(inline)
+    await async_collection("emotes").update_one(
+        {"_id": document["_id"]},
+        {"$set": {"inline-URL": document["inline-URL"],
+                  "inline-hash": document["inline-hash"]}})
+    return True
+
+
+def emote_name(path: str) -> str:
+    '''
+    Emote name from the file name of an image
+    '''
+    return re.sub(r"\W", "_", os.path.splitext(
+        os.path.basename(urlparse(path).path))[0])[:32]
+
+
+def read_zip(data: bytes) -> list:
+    '''
+    Names and contents of the images in a zip file,
+    stopping at the bulk import limits
+    '''
+    images = []
+    total = 0
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or os.path.splitext(
+                    info.filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            if info.file_size > RELAY_BYTES:
+                continue
+            if len(images) >= IMPORT_LIMIT or \
+                    (total := total + info.file_size) > ZIP_BYTES:
+                break
+            # sizes are checked before decompressing anything
+            images.append((emote_name(info.filename), archive.read(info)))
+    return images
+
+
+async def import_emotes(ctx, sources: list, progress=None) -> tuple:
+    '''
+    Imports many emotes into CES, given their names and urls (or contents).
+    Images are downloaded and processed concurrently, then uploaded to
+    the relay channel by a single task, several per message, so that the
+    channel's rate limit is respected, and inserted into the database at once.
+    Returns the names imported, and name -> reason for those that failed.
+    '''
+    queue = asyncio.Queue(RELAY_FILES * 2)
+    # downloads wait for uploads, rather than piling up in memory
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+    channel = emote_channel(ctx.guild)
+
+    documents = []
+    failed = {}
+    hashes = {}  # name -> perceptual hash of the emotes being imported
+
+    async def report():
+        if progress:
+            await progress(len(documents), len(failed))
+
+    async def download(name, source):
+        async with semaphore:
+            try:
+                if isinstance(source, bytes):
+                    content, digest = source, await emote_cache.put(source)
+                else:
+                    content, digest = await emote_cache.fetch(session, source)
+                emote_type, image, files = await prepare(name, content)
+
+                # also compared with the other emotes being imported
+                if found := [d["name"] for d in await find_duplicates(
+                        ctx.guild.id, image["phash"])] + [
+                            other for other, phash in hashes.items()
+                            if hamming(phash, image["phash"]) <=
+                            DUPLICATE_DISTANCE]:
+                    raise TypeError(f"Looks the same as `{found[0]}`.")
+                hashes[name] = image["phash"]
+            except Exception as e:
+                failed[name] = str(e) if isinstance(e, TypeError) else \
+                    "Could not download emote."
+                await report()
+                return
+        await queue.put(PreparedEmote(
+            name, emote_type, image, digest, files,
+            len(content) + len(image["inline"] or b"")))
+
+    async def send(batch):
+        try:
+            msg = await outbound.send(
+                channel, files=[f for emote in batch for f in emote.files])
+            attachments = iter(msg.attachments)
+            documents.extend([emote_document(
+                ctx.guild.id, emote.name, emote.type, emote.image,
+                emote.digest, [next(attachments) for _ in emote.files])
+                for emote in batch])
+        except Exception as e:
+            logger.error("Could not upload emotes to the relay channel",
+                         exc_info=e)
+            for emote in batch:
+                failed[emote.name] = "Could not upload emote."
+        await report()
+
+    def fits(batch, emote):
+        return sum(len(e.files) for e in batch) + len(emote.files) <= \
+            RELAY_FILES and sum(e.size for e in batch) + emote.size <= \
+            RELAY_BYTES
+
+    async def upload_all():
+        # whatever is ready is sent together, up to the limits of a message
+        waiting = object()
+        carry = await queue.get()
+        while carry is not None:
+            batch = [carry]
+            carry = waiting
+            while not queue.empty():
+                if (emote := queue.get_nowait()) is not None and \
+                        fits(batch, emote):
+                    batch.append(emote)
+                else:
+                    carry = emote
+                    break
+            await send(batch)
+            if carry is waiting:
+                carry = await queue.get()
+
+    uploader = asyncio.create_task(upload_all())
+    downloads = asyncio.ensure_future(asyncio.gather(
+        *(download(name, source) for name, source in sources)))
+    try:
+        await asyncio.wait([uploader, downloads],
+                           return_when=asyncio.FIRST_COMPLETED)
+        if uploader.done():
+            uploader.result()  # it only stops early by failing
+        await downloads
+        await queue.put(None)
+        await uploader
+    except Exception as e:
+        # downloads would otherwise wait for the full queue forever
+        logger.error("Emote import was interrupted", exc_info=e)
+        uploaded = {document["name"] for document in documents}
+        for name, _ in sources:
+            if name not in uploaded:
+                failed.setdefault(name, "Import was interrupted.")
+    finally:
+        downloads.cancel()
+        uploader.cancel()
+        await asyncio.gather(downloads, uploader, return_exceptions=True)
+
+    if documents:
+        await async_collection("emotes").insert_many(documents, ordered=False)
+        index = await emote_index(ctx.guild.id)
+        for document in documents:
+            index.add(document["name"])
+
+    return [document["name"] for document in documents], failed
+
+
+async def inject(ctx: commands.Context, name,
+                 document: dict = None) -> discord.Emoji:
     '''
     Attempts to inject image into the server's list of emoji,
     returning it afterward
     '''
-    if document := collection("emotes").find_one(
-            {"name": name, "server": ctx.guild.id}):
+    if document or (document := await async_collection("emotes").find_one(
+            {"name": name, "server": ctx.guild.id})):
         LIMIT = 50
 
-        # UNLOAD EMOJI
-        if len(ctx.guild.emojis) >= LIMIT - 1:
+        # download while other injections are using the slots
+        prefix = "inline-" if "inline-URL" in document else ""
+        # shrunk version of large images
+        content, digest = await emote_cache.fetch(
+            session, document[f"{prefix}URL"], document.get(f"{prefix}hash"))
 
-            unload = ctx.guild.emojis[0]  # emoji to be unloaded -- oldest one
+        if digest and f"{prefix}hash" not in document:
+            # emotes uploaded before the cache
+            await async_collection("emotes").update_one(
+                {"_id": document["_id"]}, {"$set": {f"{prefix}hash": digest}})
 
-            if not collection("emotes").find_one(
-                    {"name": unload.name, "server": ctx.guild.id}):
-                # If not loaded, we must first database it
+        slots = await slot_manager(ctx.guild.id)
 
-                # upload the about-to-be-destroyed emoji
-                await upload(ctx, unload.name, unload.url, "inline")
+        async with slot_locks[ctx.guild.id]:
+            # UNLOAD EMOJI
+            if slots.occupied(ctx.guild.emojis) >= LIMIT - 1:
 
-            await unload.delete(reason=f"Unloading emoji to make space for {name}")
+                # emoji to be unloaded -- least used one
+                if not (unload := slots.choose_unload(ctx.guild.emojis)):
+                    await ctx.send("Every emoji slot is pinned. "
+                                   "Unpin an emote to make space.")
+                    return None
 
-        # LOAD NEW EMOJI
-        async with session.get(document["URL"]) as resp:
-            content = await resp.read()
+                if not await async_collection("emotes").find_one(
+                        {"name": unload.name, "server": ctx.guild.id}):
+                    # If not loaded, we must first database it
 
-        return await ctx.guild.create_custom_emoji(name=document["name"], image=content, reason=f"Requested by user {ctx.author.display_name}")
+                    # upload the about-to-be-destroyed emoji
+                    await upload(ctx, unload.name, unload.url, "inline")
+
+                slots.unloading.add(unload.id)
+                try:
+                    await unload.delete(reason=f"Unloading emoji to make space for {name}")
+                except Exception:
+                    slots.unloading.discard(unload.id)
+                    raise
+
+            # LOAD NEW EMOJI
+            emoji = await ctx.guild.create_custom_emoji(name=document["name"], image=content, reason=f"Requested by user {ctx.author.display_name}")
+            slots.created.add(emoji.id)
+            return emoji
 
     else:
         await ctx.send(f"Emote `{name}` was not found in the database.")
         return None
 
 
+async def inline_many(ctx: commands.Context, names) -> dict:
+    '''
+    Gets several inline emotes at once, injecting the ones
+    which are not loaded concurrently.
+    Returns name -> emoji, leaving out emotes which were not found.
+    '''
+    # Stage 1: Search server cache
+    loaded = {emote.name: emote for emote in ctx.guild.emojis}
+    found = {name: loaded[name] for name in names if name in loaded}
+
+    # Stage 2: Search MongoDB, for all of the rest at once
+    if not (missing := [name for name in names if name not in found]):
+        await record_uses(ctx.guild.id, {emote.name for emote in found.values()})
+        return found
+
+    pending = {}  # emote name -> (document, names it was found for)
+    for name, document in (await find_emotes(ctx.guild.id, missing)).items():
+        if document["type"] != "inline":
+            continue
+        # maybe they just can't spell
+        if emote := loaded.get(document["name"]):
+            found[name] = emote
+        else:
+            pending.setdefault(
+                document["name"], (document, []))[1].append(name)
+
+    results = await asyncio.gather(
+        *(inject(ctx, emote_name, document)
+          for emote_name, (document, _) in pending.items()),
+        return_exceptions=True)
+
+    injected = 0
+    for (document, requested), emote in zip(pending.values(), results):
+        if isinstance(emote, Exception):
+            logger.error(f"Could not inject emote {document['name']}",
+                         exc_info=emote)
+        elif emote:
+            injected += 1
+            found.update((name, emote) for name in requested)
+
+    await record_uses(ctx.guild.id, {emote.name for emote in found.values()},
+                      injected)
+    return found
+
+
 async def inline(ctx: commands.Context, e: str):
     '''
     Gets an inline emote from Discord, if it exists,
     else it injects it and returns it
     Similar code to emote function
     '''
-    # Stage 1: Search server cache
-    if emote := discord.utils.get(ctx.guild.emojis, name=e):
-        return emote
-
-    # Stage 2: Search MongoDB
-    elif (
-        (document := collection("emotes").find_one(
-            {"name": e, "server": ctx.guild.id})) or
-            (document := collection("emotes").find_one({"name": re.compile('^' + e + '$', re.IGNORECASE), "server": ctx.guild.id}))) and \
-            document["type"] == "inline":
-
-        # maybe they just can't spell
-        if emote := discord.utils.get(ctx.guild.emojis, name=document["name"]):
-            return emote
-        return await inject(ctx, document["name"])
-    return None
+    return (await inline_many(ctx, [e])).get(e)
 
 
 class Emotes(commands.Cog):
@@ -133,6 +505,18 @@ class Emotes(commands.Cog):
     def __init__(self, bot):
         self.bot: commands.Bot = bot
 
+        self.save_usage.start()
+
+    def cog_unload(self):
+        self.save_usage.cancel()
+
+    @tasks.loop(minutes=5.0)
+    async def save_usage(self):
+        '''
+        Saves emote usage, which decides what to unload when slots run out
+        '''
+        await flush_usage()
+
     @commands.group(invoke_without_command=True)
     @commands.guild_only()
     async def emote(self, ctx: commands.Context, e: str):
@@ -145,27 +529,27 @@ class Emotes(commands.Cog):
 
             # Stage 1: Search server cache
             if emote := discord.utils.get(ctx.guild.emojis, name=e):
+                await record_uses(ctx.guild.id, [emote.name])
                 await echo(ctx, member=ctx.author, content=emote)
                 await ctx.message.delete()  # try to delete
 
             # Stage 2: Search MongoDB
-            elif (document := collection("emotes").find_one({"name": e, "server": ctx.guild.id})) or \
-                    (document := collection("emotes").find_one(
-                        {"name": re.compile('^' + e + '$', re.IGNORECASE),
-                         "server": ctx.guild.id})):
+            elif document := await find_emote(ctx.guild.id, e):
 
                 # 2A: inline emoji,
                 # maybe they just can't spell
                 if emote := discord.utils.get(
                         ctx.guild.emojis, name=document["name"]):
+                    await record_uses(ctx.guild.id, [emote.name])
                     await echo(ctx, member=ctx.author, content=emote)
                     await ctx.message.delete()  # try to delete
 
                 # Or, it needs to be added
                 elif document["type"] == "inline":
-                    emote = await inject(ctx, document["name"])
-                    await echo(ctx, member=ctx.author, content=emote)
-                    await ctx.message.delete()  # try to delete
+                    if emote := await inject(ctx, document["name"], document):
+                        await record_uses(ctx.guild.id, [emote.name], 1)
+                        await echo(ctx, member=ctx.author, content=emote)
+                        await ctx.message.delete()  # try to delete
 
                 # 2B: Big emoji, send as-is
                 elif document["type"] == "big":
@@ -178,6 +562,10 @@ class Emotes(commands.Cog):
                                 avatar_url=ctx.author.avatar_url,
                                 username=e)
 
+            elif suggestions := (await emote_index(ctx.guild.id)).suggest(e):
+                await ctx.send(f"Emote `{e}` was not found. Did you mean: " +
+                               ", ".join(f"`{s}`" for s in suggestions))
+
     @emote.command()
     @commands.guild_only()
     async def add(self, ctx: commands.Context, name: str, url=None):
@@ -207,7 +595,7 @@ class Emotes(commands.Cog):
             await ctx.trigger_typing()
 
             # upload as big by default
-            type = await upload(ctx, name, url)
+            type = await upload(ctx, name, url, duplicates=False)
 
             if type == "inline":
                 emote = await inject(ctx, name)
@@ -290,6 +678,90 @@ class Emotes(commands.Cog):
 
         await self.add(ctx, name, url)
 
+    @emote.command(name="import")
+    @commands.check(isOP())
+    @commands.guild_only()
+    async def bulk_import(self, ctx: commands.Context, *, source: str = ""):
+        '''
+        Imports many emotes at once, from either
+        - the ID of another server Comrade is in (all of its emoji)
+        - an attached zip file of images
+        - attached images, or urls one per line, optionally preceded by a name
+        '''
+        sources = []  # (name, url or content)
+
+        if re.fullmatch(r"\d+", source.strip()):
+            if not (guild := self.bot.get_guild(int(source))) or \
+                    not guild.get_member(ctx.author.id):
+                await ctx.send("You and Comrade must both be in that server.")
+                return
+            sources = [(e.name, str(e.url)) for e in guild.emojis]
+
+        else:
+            for attachment in ctx.message.attachments:
+                if attachment.filename.lower().endswith(".zip"):
+                    try:
+                        sources += await asyncio.get_running_loop().run_in_executor(
+                            None, read_zip, await attachment.read())
+                    except zipfile.BadZipFile:
+                        await ctx.send(f"`{attachment.filename}` is not a valid zip file.")
+                        return
+                else:
+                    sources.append(
+                        (emote_name(attachment.filename), attachment.url))
+
+            for line in source.splitlines():
+                if words := line.split():
+                    url = words[-1].strip("<>")
+                    sources.append(
+                        (words[0] if len(words) > 1 else emote_name(url), url))
+
+        # Validate names, and skip emotes which already exist
+        index = await emote_index(ctx.guild.id)
+        failed = {}
+        valid = {}
+        for name, url in sources:
+            if not re.match(r'^\w+$', name) or not 2 <= len(name) <= 32:
+                failed[name] = "Name must be 2 to 32 letters, numbers, or underscores."
+            elif not isinstance(url, bytes) and not is_url(url):
+                failed[name] = "Invalid URL."
+            elif name in index.names or name in valid:
+                failed[name] = "Already exists."
+            else:
+                valid[name] = url
+
+        if len(valid) > IMPORT_LIMIT:
+            await ctx.send(f"Only the first {IMPORT_LIMIT} emotes will be imported.")
+        valid = list(valid.items())[:IMPORT_LIMIT]
+
+        if not valid:
+            await ctx.send("No emotes to import." + "".join(
+                f"\n`{name}`: {reason}" for name, reason in failed.items())[:1900])
+            return
+
+        status = await ctx.send(f"Importing {len(valid)} emotes...")
+        start = last_update = time.monotonic()
+
+        async def progress(done, errors):
+            nonlocal last_update
+            # Edits are rate limited too, so only update every few seconds
+            if time.monotonic() - last_update >= 3:
+                last_update = time.monotonic()
+                outbound.edit(status, content=f"Importing emotes: "
+                              f"{done + errors}/{len(valid)} ({errors} failed)")
+                # not awaited; the import does not wait for its progress
+
+        imported, errors = await import_emotes(ctx, valid, progress)
+        failed.update(errors)
+
+        await outbound.edit(
+            status, content=f"Imported {len(imported)} emotes in "
+                            f"{round(time.monotonic() - start, 1)}s." + (
+                                f" {len(failed)} could not be imported:" if failed else ""))
+        if failed:
+            await ctx.send("\n".join(f"`{name}`: {reason}"
+                                     for name, reason in failed.items())[:2000])
+
     @emote.command()
     @commands.check(isOP())
     @commands.guild_only()
@@ -302,6 +774,7 @@ class Emotes(commands.Cog):
 
             collection("emotes").delete_one(
                 {"name": name, "server": ctx.guild.id})
+            (await emote_index(ctx.guild.id)).remove(name)
             await ctx.send(f"Emote `{name}` was removed.")
 
             if e["type"] == "inline":
@@ -322,11 +795,14 @@ class Emotes(commands.Cog):
         '''
         if collection("emotes").update_one(
                 {"name": name_old, "server": ctx.guild.id},
-                {"$set": {"name": name_new}}):
+                {"$set": {"name": name_new,
+                          "lowercase-name": name_new.lower()}}).matched_count:
+            (await emote_index(ctx.guild.id)).rename(name_old, name_new)
+            (await slot_manager(ctx.guild.id)).rename(name_old, name_new)
             await ctx.send(f"Emote `{name_old}` was renamed.")
 
             if e := collection("emotes").find_one(
-                {"name": name_old, "server": ctx.guild.id}):
+                {"name": name_new, "server": ctx.guild.id}):
 
                 if e["type"] == "inline":
                     emote = discord.utils.get(ctx.guild.emojis, name=name_old)
@@ -337,6 +813,111 @@ class Emotes(commands.Cog):
         else:
             await ctx.send(f"Emote `{name_old}` was not found.")
 
+    @emote.command()
+    @commands.check(isOP())
+    @commands.guild_only()
+    async def pin(self, ctx: commands.Context, name):
+        '''
+        Pins an inline emote, so that it is never unloaded to make space
+        '''
+        if document := await find_emote(ctx.guild.id, name):
+            await async_collection("emotes").update_one(
+                {"_id": document["_id"]}, {"$set": {"pinned": True}})
+            (await slot_manager(ctx.guild.id)).pinned.add(document["name"])
+            await ctx.send(f"Emote `{document['name']}` was pinned.")
+        else:
+            await ctx.send(f"Emote `{name}` was not found.")
+
+    @emote.command()
+    @commands.check(isOP())
+    @commands.guild_only()
+    async def unpin(self, ctx: commands.Context, name):
+        '''
+        Unpins an inline emote
+        '''
+        if document := await find_emote(ctx.guild.id, name):
+            await async_collection("emotes").update_one(
+                {"_id": document["_id"]}, {"$unset": {"pinned": ""}})
+            (await slot_manager(ctx.guild.id)).pinned.discard(document["name"])
+            await ctx.send(f"Emote `{document['name']}` was unpinned.")
+        else:
+            await ctx.send(f"Emote `{name}` was not found.")
+
+    @emote.command()
+    @commands.guild_only()
+    async def slots(self, ctx: commands.Context):
+        '''
+        Shows how the server's emoji slots are used by inline emotes
+        '''
+        e = discord.Embed(color=0xd7342a,
+                          title=f"__**Emoji Slots in {ctx.guild.name}**__",
+                          description=(await slot_manager(
+                              ctx.guild.id)).info(ctx.guild.emojis))
+        await ctx.send(embed=e)
+
+    @emote.command()
+    @commands.check(isOP())
+    @commands.guild_only()
+    async def duplicates(self, ctx: commands.Context, action: str = None):
+        '''
+        Finds emotes which look the same.
+        `emote duplicates merge` keeps only the pinned or most used emote
+        of each group, removing the others.
+        '''
+        await ctx.trigger_typing()
+
+        documents = await async_collection("emotes").find(
+            {"server": ctx.guild.id},
+            {"name": True, "URL": True, "hash": True, "type": True,
+             "phash": True, "uses": True, "pinned": True})
+        await hash_emotes([d for d in documents if "phash" not in d])
+
+        if not (groups := duplicate_groups(documents)):
+            await ctx.send("No duplicate emotes were found.")
+            return
+
+        if action == "merge":
+            index = await emote_index(ctx.guild.id)
+            removed = [d for group in groups for d in group[1:]]
+
+            await async_collection("emotes").delete_many(
+                {"_id": {"$in": [d["_id"] for d in removed]}})
+            await async_collection("emotes").bulk_write([
+                UpdateOne({"_id": group[0]["_id"]},
+                          {"$inc": {"uses": sum(d.get("uses", 0)
+                                                for d in group[1:])}})
+                for group in groups], ordered=False)
+
+            for d in removed:
+                index.remove(d["name"])
+                if d["type"] == "inline" and (emote := discord.utils.get(
+                        ctx.guild.emojis, name=d["name"])):
+                    try:
+                        await emote.delete(reason="Unloading emoji because "
+                                           "it was merged with a duplicate.")
+                    except BaseException:
+                        pass
+
+        paginator = commands.Paginator(prefix="", suffix="", max_size=1000)
+        for group in groups:
+            paginator.add_line(f"`{group[0]['name']}`: " + ", ".join(
+                f"`{d['name']}`" for d in group[1:]))
+        pages = paginator.pages
+
+        def em_embed(pagenum):
+            e = discord.Embed(
+                color=0xd7342a,
+                title=f"__**{'Merged' if action == 'merge' else 'Duplicate'} "
+                      f"Emotes in {ctx.guild.name}**__")
+            e.description = pages[pagenum]
+            e.set_footer(text=f"({pagenum + 1}/{len(pages)})"
+                         + ("" if action == "merge" else
+                            f" Run {bot_prefix}emote duplicates merge "
+                            "to keep only the first of each group"))
+            return e
+
+        await send_menu(ctx, [em_embed(num) for num in range(len(pages))])
+
     @emote.command()
     @commands.guild_only()
     async def gallery(self, ctx: commands.Context, start_position: int = 1):
@@ -344,23 +925,54 @@ class Emotes(commands.Cog):
         Gallery of all big emotes in server
         Can specify starting position to skip ahead
         '''
-        bigemotes = collection("emotes").find(
-            {"server": ctx.guild.id, "type": "big"}).sort(
-                "name", 1)
+        query = {"server": ctx.guild.id, "type": "big"}
+        count = await async_collection("emotes").count_documents(query)
+        if not count:
+            await ctx.send("There are no big emotes in this server.")
+            return
 
-        if not bigemotes:
-            return  # empty
-        bigemotes = list(bigemotes)
+        async def em_embed(pagenum):
+            emotes = await async_collection("emotes").find(
+                query, {"name": True, "URL": True},
+                sort=[("name", 1)], skip=pagenum, limit=1)
+            # only the emote on the page is fetched, when it is shown
 
-        def em_embed(pagenum):
             e = discord.Embed(color=0xd7342a)
-            e.set_author(name=bigemotes[pagenum]["name"],
-                         url=bigemotes[pagenum]["URL"])
-            e.set_image(url=bigemotes[pagenum]["URL"])
-            e.set_footer(text=f"{pagenum+1}/{len(bigemotes)}")
+            if not emotes:
+                e.description = "This emote was removed."
+                return e
+
+            emote = emotes[0]
+            e.set_author(name=emote["name"], url=emote["URL"])
+            e.set_image(url=emote["URL"])
+            e.set_footer(text=f"{pagenum+1}/{count}")
+            return e
+
+        await send_menu(ctx, em_embed, count, start_position - 1)
+
+    async def send_list(self, ctx: commands.Context, emote_type: str,
+                        page: int, line=lambda name: f"- {name}"):
+        '''
+        Sends a menu listing the emotes of a type, fetching
+        each page of names from the database when it is shown
+        '''
+        query = {"server": ctx.guild.id, "type": emote_type}
+        count = await async_collection("emotes").count_documents(query)
+        if not count:
+            await ctx.send(f"There are no {emote_type} emotes in this server.")
+            return
+        num_pages = -(-count // LIST_PAGE_SIZE)
+
+        async def em_embed(pagenum):
+            names = await async_collection("emotes").find(
+                query, {"name": True}, sort=[("name", 1)],
+                skip=pagenum * LIST_PAGE_SIZE, limit=LIST_PAGE_SIZE)
+            e = discord.Embed(color=0xd7342a, title=f"__**{emote_type.capitalize()} Emotes in {ctx.guild.name}**__")
+            e.set_footer(text=f"({pagenum + 1}/{num_pages})")
+            e.description = "\n".join(line(i["name"]) for i in names)
             return e
 
-        await send_menu(ctx, [em_embed(num) for num in range(len(bigemotes))])
+        await send_menu(ctx, em_embed, num_pages, page - 1)
 
     @emote.group()
     @commands.guild_only()
@@ -379,27 +991,7 @@ class Emotes(commands.Cog):
         '''
         Lists all big emotes in the server, based on page
         '''
-        paginator = commands.Paginator(prefix="", suffix="", max_size=200)
-
-        bigemotes = collection("emotes").find(
-            {"server": ctx.guild.id, "type": "big"}, {"name": True}).sort(
-                "name", 1)
-
-        if not bigemotes:
-            return  # empty
-
-        for i in bigemotes:
-            paginator.add_line(f"- {i['name']}")
-
-        pages = paginator.pages
-
-        def em_embed(pagenum):
-            e = discord.Embed(color=0xd7342a, title=f"__**Big Emotes in {ctx.guild.name}**__")
-            e.set_footer(text=f"({pagenum + 1}/{len(pages)})")
-            e.description = pages[pagenum]
-            return e
-
-        await send_menu(ctx, [em_embed(num) for num in range(len(pages))])
+        await self.send_list(ctx, "big", page)
 
     @list.command()
     @commands.guild_only()
@@ -409,30 +1001,12 @@ class Emotes(commands.Cog):
         This may not include all inline emoji,
         especially if the bot was recently added to the server.
         '''
-        paginator = commands.Paginator(prefix="", suffix="", max_size=200)
-
-        inlineemotes = collection("emotes").find(
-            {"server": ctx.guild.id, "type": "inline"}, {"name": True}).sort(
-                "name", 1)
-
-        if not inlineemotes:
-            return  # empty
+        loaded = {emote.name: emote for emote in ctx.guild.emojis}
 
-        for i in inlineemotes:
-            if emote := discord.utils.find(lambda m: m.name == i['name'], ctx.guild.emojis):
-                paginator.add_line(f"- {i['name']} {emote}")
-            else:
-                paginator.add_line(f"- {i['name']}")
-
-        pages = paginator.pages
-
-        def em_embed(pagenum):
-            e = discord.Embed(color=0xd7342a, title=f"__**Inline Emotes in {ctx.guild.name}**__")
-            e.set_footer(text=f"({pagenum + 1}/{len(pages)})")
-            e.description = pages[pagenum]
-            return e
-
-        await send_menu(ctx, [em_embed(num) for num in range(len(pages))])
+        await self.send_list(
+            ctx, "inline", page,
+            lambda name: f"- {name} {loaded[name]}" if name in loaded
+            else f"- {name}")
 
     @commands.command()
     @commands.guild_only()
@@ -440,8 +1014,7 @@ class Emotes(commands.Cog):
         '''
         Swaps the type of the emote
         '''
-        if (document := collection("emotes").find_one({"name": name, "server": ctx.guild.id})) or (document := collection(
-                "emotes").find_one({"name": re.compile('^' + name + '$', re.IGNORECASE), "server": ctx.guild.id})):
+        if document := await find_emote(ctx.guild.id, name):
             # in mongodb already; most routine change
 
             newtype = {"big": "inline", "inline": "big"}[document["type"]]
@@ -454,14 +1027,16 @@ class Emotes(commands.Cog):
                 except BaseException:
                     pass
 
-            elif (size := document["size"]) >= 262143:
-                await ctx.send(f"Emote `{document['name']}` is too big to become inline! ({round(size/1024)} kb vs 256 kb limit)")
+            elif document["size"] > INLINE_LIMIT and \
+                    "inline-URL" not in document and \
+                    not await upload_inline(ctx, document):
+                await ctx.send(f"Emote `{document['name']}` is too big to become inline, even after shrinking it!")
                 return
 
             else:
-                await inject(ctx, document['name'])  # inject the emote
+                await inject(ctx, document['name'], document)  # inject the emote
 
-            collection("emotes").update_one(
+            await async_collection("emotes").update_one(
                 {"name": document['name'], "server": ctx.guild.id}, {"$set": {"type": newtype}})
 
             await ctx.send(f"Emote `{document['name']}` is now of type `{newtype}`")
@@ -479,32 +1054,31 @@ class Emotes(commands.Cog):
             # not in mongodb or in server
             await ctx.send(f"Emote `{name}` was not found.")
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.message):
+    @message_stage(20, triggers=[pattern(INLINE_EMOTE), pattern(SWAP_EMOTE)])
+    async def emote_listener(self, mc: MessageContext):
         '''
         Emote listener
         '''
-        async def pullemote(em):
-            return await inline(await self.bot.get_context(message),
-                                em.strip(':').strip(" "))
+        message = mc.message
 
         if message.content and not message.author.bot and message.guild:
 
             # scan for inline emotes
-            if match := re.findall(
-                    r"(?<!<)(?<!a):\s*[0-9A-z]+\s*:(?!\d+>)",
-                    message.clean_content):
+            if match := set(re.findall(INLINE_EMOTE, message.clean_content)):
+                names = {i: i.strip(':').strip(" ") for i in match}
+                emotes = await inline_many(mc.ctx, set(names.values()))
+
                 s = message.content
                 send = False
                 for i in match:
-                    if emote := await pullemote(i):
+                    if emote := emotes.get(names[i]):
                         send = True
                         s = s.replace(i, str(emote))
                     # else:
                     # Handled by Go Module
 
                 if send:
-                    await echo(await self.bot.get_context(message),
+                    await echo(mc.ctx,
                                member=message.author, content=s,
                                file=await message.attachments[0].to_file()
                                if message.attachments else None,
@@ -518,5 +1092,4 @@ class Emotes(commands.Cog):
                     len(message.content) > 1:
                 # Swap type of emote
                 await self.swaptype(
-                    await self.bot.get_context(
-                        message), message.content.strip('\\').strip(" "))
+                    mc.ctx, message.content.strip('\\').strip(" "))
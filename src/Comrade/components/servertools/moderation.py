@@ -3,10 +3,13 @@ from discord.ext import commands
 import typing
 
 from utils.checks import isOP, op_list, threat_list, isServerOwner, isNotThreat
-from utils.utilities import role, ufil
-from db import collection
+from utils.utilities import role
+from db import (server_cfg, update_server_cfg,
+                user_profile, update_user_profile)
 from config import cfg
 from utils.logger import logger
+from client import message_stage, MessageContext, contains
+from .text_filter import drop_matchers
 
 
 def dynamic_threshold(guild, threshold) -> int:
@@ -59,11 +62,10 @@ class Moderation(commands.Cog):
 
         mutedrole = await role(ctx.guild, "Comrade-Mute")
 
-        user_info = collection("users").find_one(ufil(member))
+        user_info = await user_profile(member)
         vm = user_info["moderation"]["mute-votes"]
 
-        mutereq = collection(
-            "servers").find_one(ctx.guild.id)["thresholds"]["mute"]
+        mutereq = server_cfg(ctx.guild.id)["thresholds"]["mute"]
 
         '''
         Dynamic mute requirement support
@@ -79,8 +81,8 @@ class Moderation(commands.Cog):
         if ctx.author.id not in vm or OP:
 
             if not OP:
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$push": {"moderation.mute-votes": ctx.author.id}})
 
                 await ctx.send(
@@ -104,13 +106,13 @@ class Moderation(commands.Cog):
                             mutedrole,
                             send_messages=False, add_reactions=False)
 
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$set": {"moderation.mute-votes": []}})
         else:
-            collection("users").update_one(
-                    ufil(member),
-                    {"$pull": {"moderation.mute-votes": ctx.author.id}})
+            await update_user_profile(
+                member,
+                {"$pull": {"moderation.mute-votes": ctx.author.id}})
 
             await ctx.send(
                     f"Vote to {decision} {member.display_name} added. ({len(vm) - 1}/{mutereq} votes)")
@@ -121,11 +123,10 @@ class Moderation(commands.Cog):
         '''
         Votes to kick a user from the server.
         '''
-        user_info = collection("users").find_one(ufil(member))
+        user_info = await user_profile(member)
         vk = user_info["moderation"]["kick-votes"]
 
-        kickreq = collection(
-            "servers").find_one(ctx.guild.id)["thresholds"]["kick"]
+        kickreq = server_cfg(ctx.guild.id)["thresholds"]["kick"]
 
         '''
         Dynamic kick requirement
@@ -137,23 +138,23 @@ class Moderation(commands.Cog):
                 f"Dynamic mute threshold equals to {kickreq} online members needed to mute.")
 
         if ctx.author.id not in vk:
-            collection("users").update_one(
-                        ufil(member),
-                        {"$push": {"moderation.kick-votes": ctx.author.id}})
+            await update_user_profile(
+                member,
+                {"$push": {"moderation.kick-votes": ctx.author.id}})
             await ctx.send(f"Vote to kick {member.display_name} added. ({len(vk) + 1}/{kickreq} votes)")
 
             if len(vk) + 1 >= kickreq:
 
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$set": {"moderation.kick-votes": []}})
                 await ctx.guild.kick(member)
                 await ctx.send(f"{member.display_name} was kicked.")
 
         else:
-            collection("users").update_one(
-                        ufil(member),
-                        {"$pull": {"moderation.kick-votes": ctx.author.id}})
+            await update_user_profile(
+                member,
+                {"$pull": {"moderation.kick-votes": ctx.author.id}})
             await ctx.send(f"Vote to kick {member.display_name} removed. ({len(vk) - 1}/{kickreq} votes)")
 
     @commands.command()
@@ -173,38 +174,38 @@ class Moderation(commands.Cog):
         word = word.lstrip("\\")  # strip \
 
         if member:
-            user_cfg = collection("users").find_one(ufil(member))
+            user_cfg = await user_profile(member)
 
             if word in user_cfg["moderation"]["banned-words"]:
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$unset": {f"moderation.banned-words.{word}": ""}})
                 await ctx.send(
                     f"Word has been removed from {member.display_name}'s set of personal banned words.")
 
             else:
-                collection("users").update_one(
-                    ufil(member),
+                await update_user_profile(
+                    member,
                     {"$set": {f"moderation.banned-words.{word}": threshold}})
                 await ctx.send(
                     f"Word has been added to {member.display_name}'s set of personal banned words.\nActivation threshold: {threshold}%")
 
         else:
-            server_cfg = collection("servers").find_one(ctx.guild.id)
-
-            if word in server_cfg["global-banned-words"]:
-                collection("servers").update_one(
-                    {"_id": ctx.guild.id},
+            if word in server_cfg(ctx.guild.id)["global-banned-words"]:
+                await update_server_cfg(
+                    ctx.guild.id,
                     {"$unset": {f"global-banned-words.{word}": ""}})
                 await ctx.send(
                     f"Word has been removed from {ctx.guild.name}'s global banned words.")
 
             else:
-                collection("servers").update_one(
-                    {"_id": ctx.guild.id},
+                await update_server_cfg(
+                    ctx.guild.id,
                     {"$set": {f"global-banned-words.{word}": threshold}})
                 await ctx.send(
-                    f"Word has been added to {member.display_name}'s set of personal banned words.\nActivation threshold: {threshold}%")
+                    f"Word has been added to {ctx.guild.name}'s global banned words.\nActivation threshold: {threshold}%")
+
+        drop_matchers(ctx.guild.id, member.id if member else None)
 
     @commands.command()
     @commands.check(isOP())
@@ -214,7 +215,7 @@ class Moderation(commands.Cog):
         '''
         Bans images on a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"moderation.stop-images": True}})
+        await update_user_profile(member, {"$set": {"moderation.stop-images": True}})
         await ctx.send(f"{member.display_name} can no longer send images.")
 
     @commands.command()
@@ -225,7 +226,7 @@ class Moderation(commands.Cog):
         '''
         unBans images on a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"moderation.stop-images": False}})
+        await update_user_profile(member, {"$set": {"moderation.stop-images": False}})
         await ctx.send(f"{member.display_name} can send images.")
 
 
@@ -237,7 +238,7 @@ class Moderation(commands.Cog):
         '''
         Bans reactions on a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"moderation.stop-reactions": True}})
+        await update_user_profile(member, {"$set": {"moderation.stop-reactions": True}})
         await ctx.send(f"{member.display_name} can no longer react.")
 
     @commands.command()
@@ -248,7 +249,7 @@ class Moderation(commands.Cog):
         '''
         unBans reactions on a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"moderation.stop-reactions": False}})
+        await update_user_profile(member, {"$set": {"moderation.stop-reactions": False}})
         await ctx.send(f"{member.display_name} can react.")
 
 
@@ -260,7 +261,7 @@ class Moderation(commands.Cog):
         '''
         Bans pings on a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"moderation.stop-pings": True}})
+        await update_user_profile(member, {"$set": {"moderation.stop-pings": True}})
         await ctx.send(f"{member.display_name} can no longer ping.")
 
     @commands.command()
@@ -271,7 +272,7 @@ class Moderation(commands.Cog):
         '''
         Bans pings on a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"moderation.stop-pings": False}})
+        await update_user_profile(member, {"$set": {"moderation.stop-pings": False}})
         await ctx.send(f"{member.display_name} can ping.")
 
     @commands.command()
@@ -280,7 +281,7 @@ class Moderation(commands.Cog):
         '''
         OPs a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"OP": True}})
+        await update_user_profile(member, {"$set": {"OP": True}})
         op_list.cache_clear()
         await ctx.send(f"{member.display_name} is now OP.")
 
@@ -290,7 +291,7 @@ class Moderation(commands.Cog):
         '''
         de-OPs a member
         '''
-        collection("users").update_one(ufil(member), {"$set": {"OP": False}})
+        await update_user_profile(member, {"$set": {"OP": False}})
         op_list.cache_clear()
         await ctx.send(f"{member.display_name} is no longer OP.")
 
@@ -300,9 +301,7 @@ class Moderation(commands.Cog):
         '''
         sets a member's threat level
         '''
-        collection(
-            "users").update_one(
-                ufil(member), {"$set": {"moderation.threat-level": level}})
+        await update_user_profile(member, {"$set": {"moderation.threat-level": level}})
         threat_list.cache_clear()
         assert member.id in threat_list(ctx.guild.id, level)
 
@@ -311,14 +310,18 @@ class Moderation(commands.Cog):
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
         if reaction.message.guild:
-            u = collection("users").find_one({"user": user.id, "server": reaction.message.guild.id})
+            if not (member := reaction.message.guild.get_member(user.id)):
+                return
+
+            u = await user_profile(member)
 
-            if "stop-reactions" in u["moderation"] and u["moderation"]["stop-reactions"]:
+            if u and u["moderation"].get("stop-reactions"):
                 await reaction.clear()
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.message):
-        if not message.author.bot and message.guild and \
+    @message_stage(10, triggers=[contains("ZA HANDO")])
+    async def za_hando(self, mc: MessageContext):
+        message = mc.message
+        if not message.author.bot and mc.server and \
                "ZA HANDO" in message.content:
             args = (message.content.lower()).split()
             amount = 20
@@ -326,16 +329,14 @@ class Moderation(commands.Cog):
             if len(args) > 2 and args[2].isnumeric():
                 amount = int(args[2])
 
-            if not isNotThreat()(await self.bot.get_context(message)):
+            if not isNotThreat()(mc.ctx):
                 await message.channel.send("Nah")
                 return
 
-            if amount > 200 and not isOP()(await self.bot.get_context(message)):
+            if amount > 200 and not isOP()(mc.ctx):
                 await message.channel.send("No")
             else:
-                duration = collection(
-                    "servers").find_one(
-                        message.guild.id)["durations"]["zahando"]
+                duration = mc.server["durations"]["zahando"]
 
                 froom = "from " + str(message.mentions[0]) if message.mentions else ""
 
@@ -347,7 +348,7 @@ class Moderation(commands.Cog):
 
                 voted = [message.author.id]
 
-                op = isOP()(await self.bot.get_context(message))
+                op = isOP()(mc.ctx)
 
                 def check(reaction, user):
 
@@ -2,64 +2,391 @@ import discord
 from discord.ext import commands
 
 # Text Filtering
-import re
-import unidecode
+import sys
+import time
+import asyncio
+from hashlib import blake2b
 
-from fuzzywuzzy import fuzz
-# install python-Levenshtein for faster results.
-# pip install python-levenshtein ==> * needs C++ build tools installed
+import numpy
+from rapidfuzz import fuzz, process
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
-from utils.emoji_converter import emojiToText
-from db import collection, RELAY_ID
+from utils.normalizer import normalize
+from client import pipeline, message_stage, MessageContext
 
 from utils.logger import logger
+from utils.outbound import outbound
 from config import cfg
-from utils.utilities import ufil
 
 
-def content_filter(message: discord.Message) -> bool:
+def content_filter(message: discord.Message, user: dict) -> bool:
     '''
     Checks a message for additional offending characteristics based on member
     Filters pings and images
     '''
-    u = collection("users").find_one(ufil(message.author))
-    return (u["moderation"]["stop-pings"] and message.mentions) or (
-        u["moderation"]["stop-images"] and (
+    return (user["moderation"]["stop-pings"] and message.mentions) or (
+        user["moderation"]["stop-images"] and (
             message.attachments or message.embeds))
 
 
-def text_filter(content: str,
-                author: discord.Member,
-                guild: discord.Guild) -> bool:
+def word_list_version(words: dict) -> int:
     '''
-    Detects banned words in a string
+    Version of a list of banned words, which changes with its contents
     '''
-    spaced_query = unidecode.unidecode(emojiToText(content.lower()))
-    # remove non-ascii, attempt to decode unicode,
-    # get into formattable form
-    query = re.sub(r"\W+", '', spaced_query)  # spaces
+    return hash(frozenset(words.items())) if words else 0
 
-    server_words: dict = collection(
-        "servers").find_one(guild.id)["global-banned-words"]
-    words: dict = collection(
-        "users").find_one(ufil(author))["moderation"]["banned-words"]
 
-    words.update(server_words)
+class BannedWordMatcher:
+    '''
+    Banned words of a member (their own merged with the server's),
+    precompiled into three tiers:
+    exact matches, words bucketed by their first and last letters,
+    and fuzzy thresholds for batched scoring
+    '''
+    def __init__(self, server: int, server_words: dict, user_words: dict):
+        self.server = server
+        self.sources = (server_words, user_words)
+
+        self.versions = (word_list_version(server_words),
+                         word_list_version(user_words))
+        # members without personal banned words share verdicts
+
+        # TODO with python 3.9 -- dictionary union
+        words = {w: t for w, t in {**user_words, **server_words}.items() if w}
+
+        self.exact = set(words)
+        self.longest = max(map(len, words), default=0)
+
+        self.fuzzy = [w for w in words if words[w] < 100]
+        self.fuzzy_thresholds = numpy.array([words[w] for w in self.fuzzy])
+        # words which also match the whole message by similarity
+
+        self.buckets = defaultdict(list)
+        # (first letter, last letter) -> words
+        for w in words:
+            self.buckets[w[0], w[-1]].append(w)
+        self.bucket_thresholds = {
+            k: numpy.array([words[w] for w in v])
+            for k, v in self.buckets.items()}
 
-    # TODO with python 3.9 -- dictionary union
-    for w in words:
+    def matches(self, query: str, tokens: list) -> bool:
+        '''
+        query is the message with all non-word characters removed,
+        tokens are the space separated words of the message
+        '''
+        if query in self.exact or not self.exact.isdisjoint(tokens):
+            return True
 
-        if words[w] < 100 and (
-            len(query) > 2 and fuzz.partial_ratio(query, w) >= words[w]) or query == w:
+        if self.fuzzy and len(query) > 2 and (process.cdist(
+                [query], self.fuzzy, scorer=fuzz.partial_ratio)[0] >=
+                self.fuzzy_thresholds).any():
             return True
 
-        for word in spaced_query.split(" "):
-            if word and word[0] == w[0] and word[-1] == w[-1] and fuzz.partial_ratio(word, w) >= words[w]:
+        candidates = defaultdict(list)
+        # tokens grouped by the bucket they would be compared against
+        for token in tokens:
+            if token and (token[0], token[-1]) in self.buckets:
+                candidates[token[0], token[-1]].append(token)
+
+        for k, bucket_tokens in candidates.items():
+            if (process.cdist(bucket_tokens, self.buckets[k],
+                              scorer=fuzz.partial_ratio) >=
+                    self.bucket_thresholds[k]).any():
+                return True
+        return False
+
+
+    def matches_appended(self, window: "ChainWindow", query: str) -> bool:
+        '''
+        Whether appending a message to a window of earlier messages
+        creates a match in their joined text.
+        The window has already been checked, so only the text within
+        reach of a banned word from the boundary is compared.
+        '''
+        if not self.exact or not window.queries or \
+                not (query or window.popped):
+            return False
+
+        reach = self.longest - 1
+        joined_length = window.length + len(query)
+
+        if len(head := window.tail(reach)) == window.length:
+            # the whole window is within reach
+            if (text := head + query) in self.exact:
                 return True
-            # checking endcap letters
-    return False
+            texts = [text]
+        else:
+            texts = [SENTINEL * reach + head + query]
+            # padding stands in for the rest of the window, so that the
+            # cut is not scored as the start of the text by partial_ratio
+
+            if window.popped:
+                # dropping old messages gave the text a new start
+                texts.append(window.head(reach) + SENTINEL * reach)
+
+        window.popped = False
+
+        return bool(self.fuzzy) and joined_length > 2 and (process.cdist(
+            texts, self.fuzzy, scorer=fuzz.partial_ratio) >=
+            self.fuzzy_thresholds).any()
+
+
+class ChainWindow:
+    '''
+    Recent messages of a member, used to catch banned words
+    split across several messages.
+    Only what is needed to check and delete them is kept:
+    (channel id, message id), normalized text and time received
+    '''
+    __slots__ = ("ids", "queries", "times", "length", "popped")
+
+    def __init__(self):
+        self.ids = []
+        self.queries = []
+        self.times = []
+        self.length = 0  # length of the joined queries
+        self.popped = False
+
+    def append(self, ids: tuple, query: str):
+        self.ids.append(ids)
+        self.queries.append(query)
+        self.times.append(time.monotonic())
+        self.length += len(query)
+
+    def pop(self):
+        self.ids.pop(0)
+        self.times.pop(0)
+        self.length -= len(self.queries.pop(0))
+        self.popped = True
+
+    def clear(self):
+        self.ids.clear()
+        self.queries.clear()
+        self.times.clear()
+        self.length = 0
+        self.popped = False
+
+    def head(self, n: int) -> str:
+        '''
+        First n characters of the joined queries
+        '''
+        parts = []
+        size = 0
+        for query in self.queries:
+            if size >= n:
+                break
+            parts.append(query)
+            size += len(query)
+        return "".join(parts)[:n]
+
+    def tail(self, n: int) -> str:
+        '''
+        Last n characters of the joined queries
+        '''
+        if n <= 0:
+            return ""
+
+        parts = []
+        size = 0
+        for query in reversed(self.queries):
+            parts.append(query)
+            if (size := size + len(query)) >= n:
+                break
+        return "".join(reversed(parts))[-n:]
+
+
+class ChainBuffers:
+    '''
+    Chain windows of every member, bounded per window (limit),
+    in time (ttl, seconds) and in total number of messages (capacity).
+    Windows are kept in order of activity, so the idle ones are
+    expired and evicted first.
+    '''
+    def __init__(self, limit: int, ttl: float, capacity: int):
+        self.limit = limit
+        self.ttl = ttl
+        self.capacity = capacity
+
+        self.windows = OrderedDict()  # (server, member) -> ChainWindow
+        self.size = 0  # messages across all windows
+
+        self.expired = 0
+        self.evicted = 0
+
+    def window(self, key: tuple) -> ChainWindow:
+        '''
+        Returns the window of a member, without its expired messages
+        '''
+        self.sweep()
+
+        if (window := self.windows.get(key)) is None:
+            window = self.windows[key] = ChainWindow()
+        self.windows.move_to_end(key)
+
+        cutoff = time.monotonic() - self.ttl
+        while window.times and window.times[0] < cutoff:
+            window.pop()
+            self.size -= 1
+            self.expired += 1
+        return window
+
+    def append(self, window: ChainWindow, ids: tuple, query: str):
+        window.append(ids, query)
+        self.size += 1
+
+        if len(window.ids) > self.limit:
+            window.pop()
+            self.size -= 1
+
+        while self.size > self.capacity and len(self.windows) > 1:
+            _, evicted = self.windows.popitem(last=False)
+            self.size -= len(evicted.ids)
+            self.evicted += len(evicted.ids)
+
+    def clear(self, window: ChainWindow):
+        self.size -= len(window.ids)
+        window.clear()
+
+    def sweep(self):
+        '''
+        Drops the windows which have been idle for longer than the ttl
+        '''
+        cutoff = time.monotonic() - self.ttl
+        while self.windows:
+            key, window = next(iter(self.windows.items()))
+            if window.times and window.times[-1] >= cutoff:
+                break
+            del self.windows[key]
+            self.size -= len(window.ids)
+            self.expired += len(window.ids)
+
+    def footprint(self) -> int:
+        '''
+        Approximate memory used by the buffers, in bytes
+        '''
+        return sys.getsizeof(self.windows) + sum(
+            sys.getsizeof(w) + sum(map(sys.getsizeof, w.queries)) +
+            sum(map(sys.getsizeof, w.ids)) + 24 * len(w.times)
+            # size of a float
+            for w in self.windows.values())
+
+    def info(self) -> str:
+        return (f"ChainBuffers(windows={len(self.windows)}, "
+                f"messages={self.size}/{self.capacity}, "
+                f"expired={self.expired}, evicted={self.evicted}, "
+                f"footprint={round(self.footprint() / 1024, 1)} KiB, "
+                f"ttl={self.ttl}s)")
+
+
+SENTINEL = "\0"
+# never part of a normalized query
+
+# (server, user) -> BannedWordMatcher, least recently used first
+matchers = OrderedDict()
+MATCHER_LIMIT = int(cfg["Performance"].get("user-cache-size", "4096"))
+
+
+def banned_word_matcher(server: dict, user: dict) -> BannedWordMatcher:
+    '''
+    Returns the compiled matcher of a member.
+    Matchers are rebuilt when either list of banned words was replaced,
+    which every cached write does (see db.cache)
+    '''
+    key = (server["_id"], user["user"])
+    server_words = server["global-banned-words"]
+    user_words = user["moderation"]["banned-words"]
+
+    if (matcher := matchers.get(key)) and \
+            matcher.sources[0] is server_words and \
+            matcher.sources[1] is user_words:
+        matchers.move_to_end(key)
+        return matcher
+
+    matcher = matchers[key] = BannedWordMatcher(
+        key[0], server_words, user_words)
+    matchers.move_to_end(key)
+
+    while len(matchers) > MATCHER_LIMIT:
+        matchers.popitem(last=False)
+    return matcher
+
+
+def drop_matchers(server: int, user: int = None):
+    '''
+    Discards the matchers of a server, or of one of its members,
+    and the verdicts made with the server's previous banned words
+    '''
+    for key in [k for k in matchers if k[0] == server and (
+            user is None or k[1] == user)]:
+        del matchers[key]
+    verdicts.evict_where(server)
+
+
+class VerdictCache:
+    '''
+    Bounded LRU cache of text filter verdicts, keyed by
+    (server, server word list version, member word list version,
+    hash of the normalized content)
+    '''
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> bool:
+        if (verdict := self.entries.get(key)) is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return verdict
+
+    def put(self, key: tuple, verdict: bool):
+        self.entries[key] = verdict
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def evict_where(self, server: int):
+        for key in [k for k in self.entries if k[0] == server]:
+            del self.entries[key]
+
+    def info(self) -> str:
+        total = self.hits + self.misses
+        return (f"VerdictCache(hits={self.hits}, misses={self.misses}, "
+                f"hit_rate={round(self.hits / total * 100, 1) if total else 0}%, "
+                f"size={len(self.entries)}/{self.maxsize})")
+
+
+verdicts = VerdictCache(
+    int(cfg["Performance"].get("filter-verdict-cache-size", "8192")))
+
+
+def verdict(matcher: BannedWordMatcher, spaced_query: str, query: str) -> bool:
+    '''
+    Whether a normalized message contains banned words,
+    remembered for repeated messages (spam, copypasta)
+    '''
+    key = (matcher.server, *matcher.versions, blake2b(
+        spaced_query.encode(), digest_size=16).digest())
+
+    if (result := verdicts.get(key)) is None:
+        result = bool(matcher.matches(query, spaced_query.split(" ")))
+        verdicts.put(key, result)
+    return result
+
+
+def text_filter(content: str, server: dict, user: dict) -> bool:
+    '''
+    Detects banned words in a string,
+    given the server config and user profile of the author
+    '''
+    spaced_query, query = normalize(content)
+
+    return verdict(banned_word_matcher(server, user), spaced_query, query)
 
 
 class TextFilter(commands.Cog):
@@ -69,37 +396,66 @@ class TextFilter(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-        self.bucket = defaultdict(lambda: defaultdict(list))
-        # stores a bunch of messages
+        self.buffers = ChainBuffers(
+            int(cfg["Performance"]["moderation-buffer-limit"]),
+            float(cfg["Performance"].get("moderation-buffer-ttl", "300")),
+            int(cfg["Performance"].get("moderation-buffer-capacity", "50000")))
+        # recent messages of every member
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.message):
-        if not message.author.bot and message.guild and \
-                message.guild.id != RELAY_ID:
-            # moderation system
-            if text_filter(message.content, message.author, message.guild) or \
-                    content_filter(message):
-                await message.delete()
-
-            else:
-                message_chain: list = self.bucket[
-                    message.guild.id][message.author.id]
-                message_chain.append(message)
-
-                joined = " ".join([m.content for m in message_chain])
-
-                if text_filter(joined, message.author, message.guild):
-                    for m in message_chain:
-                        try:
-                            await m.delete()
-                        except Exception:
-                            logger.exception(
-                                f"Cannot delete message {m.content}")
-                    message_chain.clear()
-
-                elif len(message_chain) > int(
-                        cfg["Performance"]["moderation-buffer-limit"]):
-                    message_chain.pop(0)
+    @message_stage(0, gate=True)
+    async def filter_message(self, mc: MessageContext) -> bool:
+        '''
+        Moderation system; deletes offending messages
+        and stops them from going through the rest of the pipeline
+        '''
+        message = mc.message
+
+        if message.author.bot or mc.server is None or mc.user is None:
+            return False
+
+        spaced_query, query = normalize(message.content)
+        matcher = banned_word_matcher(mc.server, mc.user)
+
+        if verdict(matcher, spaced_query, query) or \
+                content_filter(message, mc.user):
+            await outbound.delete(message)
+            return True
+
+        window = self.buffers.window((message.guild.id, message.author.id))
+
+        if matcher.matches_appended(window, query):
+            chain = list(window.ids)
+            self.buffers.clear(window)
+            # before awaiting, while the window is still the one matched
+
+            ids, deletes = [], []
+            for channel_id, message_id in chain:
+                if (channel := self.bot.get_channel(channel_id)) is None:
+                    logger.error(f"Cannot delete message {message_id}, "
+                                 f"channel {channel_id} is gone")
+                    continue
+                ids.append(message_id)
+                deletes.append(outbound.delete(
+                    channel.get_partial_message(message_id)))
+
+            results = await asyncio.gather(
+                *deletes, outbound.delete(message), return_exceptions=True)
+            for message_id, result in zip(ids, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Cannot delete message {message_id}",
+                                 exc_info=result)
+            return True
+
+        self.buffers.append(window, (message.channel.id, message.id), query)
+        return False
+
+    @commands.command()
+    @commands.is_owner()
+    async def filterstats(self, ctx: commands.Context):
+        '''
+        Shows the verdict cache and the footprint of the message buffers
+        '''
+        await ctx.send(f"{verdicts.info()}\n{self.buffers.info()}")
 
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload):
@@ -112,4 +468,5 @@ class TextFilter(commands.Cog):
             payload.cached_message else payload.cached_message
 
         if message:
-            await self.on_message(message)
+            await self.filter_message(
+                await pipeline.build_context(message))
@@ -6,7 +6,8 @@ import typing
 import datetime
 import re
 
-from db import collection, RELAY_ID
+from db import (collection, server_cfg, user_profile,
+                update_user_profile, drop_user_profiles, RELAY_ID)
 from utils.utilities import ufil, local_time, bot_prefix, utc_to_local_time
 from utils.users import random_member_from_server, weight_table
 from utils.checks import isOP
@@ -47,8 +48,7 @@ class Users(commands.Cog):
                         '%B %d %Y at %I:%M:%S %p %Z'), inline=False)
 
         if ctx.guild:
-            user_information = collection(
-                "users").find_one(ufil(member))
+            user_information = await user_profile(member)
 
             e.add_field(name="Joined Server",
                         value=utc_to_local_time(member.joined_at).strftime(
@@ -102,18 +102,17 @@ class Users(commands.Cog):
         Makes it so that when a user changes status, you are notified.
         This command is a toggle.
         '''
-        notifiees = collection(
-            "users").find_one(ufil(member))["notify-status"]
+        notifiees = (await user_profile(member))["notify-status"]
 
         if ctx.author.id in notifiees:
-            collection("users").update_one(
-                ufil(member),
+            await update_user_profile(
+                member,
                 {"$pull": {"notify-status": ctx.author.id}})
             await ctx.send(
                 f"You will no longer be notified by when {member.display_name} changes their status.")
         else:
-            collection("users").update_one(
-                ufil(member),
+            await update_user_profile(
+                member,
                 {"$push": {"notify-status": ctx.author.id}})
             await ctx.send(
                 f"You will now be notified by when {member.display_name} changes their status.")
@@ -128,10 +127,9 @@ class Users(commands.Cog):
         '''
         if name and member:
             # Case: assign name to member
-            collection(
-                "users").update_one(
-                    ufil(member),
-                    {"$set": {"identity": name}})
+            await update_user_profile(
+                member,
+                {"$set": {"identity": name}})
             await reactOK(ctx)
         elif name and (real_user := collection(
             "users").find_one(
@@ -141,8 +139,7 @@ class Users(commands.Cog):
             await self.userinfo(ctx, member=user)
 
         elif member:
-            await ctx.send(collection(
-                "users").find_one(ufil(member))["identity"])
+            await ctx.send((await user_profile(member))["identity"])
         else:
             await ctx.send("No identity listed")
 
@@ -184,6 +181,9 @@ class Users(commands.Cog):
                 collection("users").update_one(
                     ufil(member), {"$set": {"daily-weight": 0}})
         s += "```"
+
+        if trim and OP:
+            drop_user_profiles(server=ctx.guild.id)
         await ctx.send(s)
 
         if trim:
@@ -203,8 +203,7 @@ class Users(commands.Cog):
 
         sum_of_weights = sum(weights)
 
-        count = collection(
-            "users").find_one(ufil(member))["daily-weight"]
+        count = (await user_profile(member))["daily-weight"]
 
         if sum_of_weights > 0:
             await ctx.send(
@@ -235,9 +234,8 @@ class Users(commands.Cog):
         '''
         When a member joins the server.
         '''
-        announcements_channel_id = collection(
-            "servers").find_one(
-                member.guild.id)["channels"]["announcements"]
+        announcements_channel_id = server_cfg(
+            member.guild.id)["channels"]["announcements"]
         if channel := member.guild.get_channel(announcements_channel_id):
             await channel.send(f"Welcome {member.display_name}!")
         logger.info("Member join")
@@ -250,18 +248,19 @@ class Users(commands.Cog):
         '''
         When a member leaves the server
         '''
-        announcements_channel_id = collection(
-            "servers").find_one(member.guild.id)["channels"]["announcements"]
+        announcements_channel_id = server_cfg(
+            member.guild.id)["channels"]["announcements"]
 
         if channel := member.guild.get_channel(announcements_channel_id):
 
             await channel.send(f":door: {member.display_name} has left.")
         logger.info("Member leave")
 
-        uprofile = collection("users").find_one(ufil(member))
+        uprofile = await user_profile(member)
 
         if not uprofile["moderation"]["threat-level"]:
             collection("users").delete_one(ufil(member))
+            drop_user_profiles(member.guild.id, member.id)
             # Delete DB entry if member's threat level is nonzero only
 
     @commands.Cog.listener()
@@ -275,20 +274,18 @@ class Users(commands.Cog):
 
             if str(after.status) == "offline":
 
-                collection("users").update_one(
-                    ufil(after),
+                col = await update_user_profile(
+                    after,
                     {"$set": {
                         "last-online":
                         local_time().strftime("%I:%M:%S %p %Z")}})
             else:
-                collection("users").update_one(
-                    ufil(after),
+                col = await update_user_profile(
+                    after,
                     {"$set": {
                         "last-online": "Now"}})
 
-            if col := collection(
-                    "users").find_one(
-                        ufil(after)):
+            if col:
 
                 for mem_id in col["notify-status"]:
                     mem = after.guild.get_member(mem_id)
@@ -5,7 +5,7 @@ import random
 import asyncio
 from async_lru import alru_cache
 
-from db import collection
+from db import server_cfg
 from utils.echo import echo, mimic
 from utils.reactions import reactOK
 from utils.checks import isOP
@@ -19,7 +19,7 @@ from client import discord_client as bot
 @alru_cache(maxsize=8)
 async def vault_posts(guild_id: int):
     vault: discord.TextChannel = bot.get_channel(
-            collection("servers").find_one(guild_id)["channels"]["vault"])
+            server_cfg(guild_id)["channels"]["vault"])
     return (await vault.history(limit=None).flatten())
 
 
@@ -68,8 +68,7 @@ class Vault(commands.Cog):
             except Exception:
                 u = tgt  # URL directly
 
-        duration = collection("servers").find_one(ctx.guild.id)[
-            "durations"]["vault"]
+        duration = server_cfg(ctx.guild.id)["durations"]["vault"]
 
 
         ee = discord.Embed(color=0xd7342a,
@@ -89,7 +88,7 @@ class Vault(commands.Cog):
             await self.bot.wait_for("reaction_add", check=check, timeout=duration)
 
             vault = ctx.guild.get_channel(
-                collection("servers").find_one(ctx.guild.id)["channels"]["vault"])
+                server_cfg(ctx.guild.id)["channels"]["vault"])
 
             if IDmode:
                 e = discord.Embed(color=0xd7342a,
@@ -3,6 +3,8 @@ from discord.ext import commands
 import wave
 import io
 
+from client import message_stage, MessageContext, contains
+
 
 class PCM2WAV(commands.Cog):
     '''
@@ -11,11 +13,12 @@ class PCM2WAV(commands.Cog):
     def __init__(self, bot):
         self.bot: commands.Bot = bot
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    @message_stage(90, triggers=[contains("convert")])
+    async def convert_listener(self, mc: MessageContext):
         '''
         Listens for messages asking the bot to convert a file
         '''
+        message = mc.message
         if message.author != self.bot.user and self.bot.user in message.mentions \
                 and message.attachments and "convert" in message.content:
 
@@ -2,22 +2,64 @@
 This module generates text using a Markov chain algorithm.
 Text generation is based off of what each user has said in
 a given text channel.
-Models are cached using a LRU (Least-recently-used) system,
-which makes it so that previously generated models can be
-used again
+The counts behind each model are stored in the database, and updated
+as users post, so that models survive restarts and a channel's history
+is only read the first time a model is built.
+Models in use are cached using a LRU (Least-recently-used) system.
 '''
 import discord
-from discord.ext import commands
-from collections import Counter, defaultdict  # markov
-from async_lru import alru_cache
-import random
+from discord.ext import commands, tasks
+from collections import Counter, OrderedDict, defaultdict
+from pymongo import UpdateOne
 import typing
 import time
+import asyncio
 from config import cfg
-from client import client as bot
+from client import client as bot, message_stage, MessageContext
+from db import async_collection
 from utils.echo import echo
+from utils.logger import logger
+from utils.markov import TextModel, count_grams, MODEL_LEN
 
-MODEL_LEN = 3  # Length of text generation model
+MODEL_LIMIT = int(cfg["Performance"]["text-model-limit"])
+HISTORY_DEPTH = 100
+# messages read from history when a model is built for the first time
+
+# (channel id, member id) -> TextModel, least recently used first
+models = OrderedDict()
+# (channel id, member id) -> grams counted but not yet written
+pending = defaultdict(Counter)
+# (channel id, member id) -> end of the member's last message
+tails = {}
+# (channel id, member id) of every model in the database
+stored = set()
+# (channel id, member id) -> messages learned, to tell if a model being built
+# is already out of date
+learned = Counter()
+# (channel id, member id) -> task building the model
+building = {}
+
+
+def model_store():
+    '''
+    Collection storing the text models, or None if it is not configured,
+    in which case models are built from history and only kept in memory
+    '''
+    return async_collection("textmodels")
+
+
+def escape(gram: str) -> str:
+    '''
+    Field name for a gram, since MongoDB field names
+    cannot contain "." or "$"
+    '''
+    return gram.replace("%", "%25").replace(".", "%2E") \
+        .replace("$", "%24").replace("\0", "%00")
+
+
+def unescape(field: str) -> str:
+    return field.replace("%00", "\0").replace("%24", "$") \
+        .replace("%2E", ".").replace("%25", "%")
 
 
 async def member_msgs(channel_id: int, member_id: int, depth: int):
@@ -42,45 +84,99 @@ async def member_msgs(channel_id: int, member_id: int, depth: int):
     # For example, your channel only has 10 messages, and depth = 100
 
 
-@alru_cache(maxsize=int(cfg["Performance"]["text-model-limit"]))
-async def text_model(channel_id: int, member_id: int):
+def learn(key: tuple, content: str):
     '''
-    Returns text model for a given user in a given channel.
-    Sped up using a LRU cache.
+    Counts the grams of a new message, following the member's last one
     '''
-    msgs = [m.content async for m in member_msgs(
-        channel_id, member_id, 100)]
+    text = f"{tails[key]} {content}" if key in tails else content
+    pending[key].update(count_grams(text))
+    tails[key] = text[-MODEL_LEN:]
+    learned[key] += 1
 
-    text = " ".join(msgs)
+    models.pop(key, None)  # rebuilt with the new counts when next used
 
-    # calls a counter object in the event that an index doesn't exist
-    model = defaultdict(Counter)
 
-    for i in range(len(text) - MODEL_LEN):
-        model[text[i:(i + MODEL_LEN)]][text[i + MODEL_LEN]] += 1
+async def flush_models(keys=None):
+    '''
+    Writes the counts recorded in memory to the database,
+    for some models or all of them
+    '''
+    updates = []
+    for key in list(pending if keys is None else keys):
+        if grams := pending.pop(key, None):
+            updates.append(UpdateOne(
+                {"channel": key[0], "user": key[1]},
+                {"$inc": {f"counts.{escape(g)}": n for g, n in grams.items()},
+                 "$set": {"tail": tails[key]}}, upsert=True))
 
-    return model
+    if updates and (store := model_store()) is not None:
+        await store.bulk_write(updates, ordered=False)
 
 
-def generate_text(model, num_chars):
+async def build_model(key: tuple) -> TextModel:
     '''
-    Generates num_chars characters of text given a character model
+    Builds a text model from the database, or the first time,
+    from the channel's history
     '''
-    if len(model) == 0:
-        return None
-    selector = random.choice(list(model.keys()))  # select a starting character
+    channel_id, member_id = key
+    version = learned[key]
+    store = model_store()
 
-    output = selector
+    if store is not None:
+        stored.add(key)
+        # messages posted from now on are learned, even while history is read
+        await flush_models([key])
+        document = await store.find_one(
+            {"channel": channel_id, "user": member_id})
+    else:
+        document = None
 
-    for i in range(num_chars):
-        if len(model[selector]) == 0:
-            break
-        # generate next character
-        output += random.choices(list(model[selector]),
-                                 model[selector].values())[0]
-        selector = output[-MODEL_LEN:]
+    if document:
+        counts = {unescape(f): n
+                  for f, n in document.get("counts", {}).items()}
+        tails.setdefault(key, document["tail"])
+
+    else:
+        msgs = [m.content async for m in member_msgs(
+            channel_id, member_id, HISTORY_DEPTH)]
+
+        text = " ".join(reversed(msgs))  # oldest first
+        counts = count_grams(text)
+        tails.setdefault(key, text[-MODEL_LEN:])
+
+        if store is not None:
+            # added to any counts of new messages saved in the meantime
+            update = {"$setOnInsert": {"tail": text[-MODEL_LEN:]}}
+            if counts:
+                update["$inc"] = {f"counts.{escape(g)}": n
+                                  for g, n in counts.items()}
+            await store.update_one({"channel": channel_id, "user": member_id},
+                                   update, upsert=True)
+
+    model = TextModel.from_counts(counts)
+    if learned[key] == version:
+        # otherwise it is already missing new messages, and is rebuilt
+        models[key] = model
+        while len(models) > MODEL_LIMIT:
+            models.popitem(last=False)
+    return model
+
+
+async def text_model(channel_id: int, member_id: int) -> TextModel:
+    '''
+    Returns text model for a given user in a given channel,
+    from the cache, or built once for concurrent requests
+    '''
+    key = (channel_id, member_id)
 
-    return output
+    if (model := models.get(key)) is not None:
+        models.move_to_end(key)
+        return model
+
+    if (task := building.get(key)) is None:
+        task = building[key] = asyncio.ensure_future(build_model(key))
+        task.add_done_callback(lambda _: building.pop(key, None))
+    return await asyncio.shield(task)
 
 
 class Textgen(commands.Cog):
@@ -91,6 +187,44 @@ class Textgen(commands.Cog):
     def __init__(self, bot):
         self.bot: commands.Bot = bot
 
+        self.save_models.start()
+
+    def cog_unload(self):
+        self.save_models.cancel()
+
+    @tasks.loop(minutes=1.0)
+    async def save_models(self):
+        '''
+        Saves what text models learned from new messages
+        '''
+        try:
+            await flush_models()
+        except Exception:
+            logger.exception("Could not save text models")
+
+    @save_models.before_loop
+    async def load_models(self):
+        '''
+        Finds which models are stored, and so should learn from new messages
+        '''
+        if (store := model_store()) is None:
+            logger.warning("No textmodels collection is set under [MongoDB] "
+                           "in cfg.ini, so text models will not be saved")
+            return
+
+        stored.update((d["channel"], d["user"]) for d in await store.find(
+            {}, {"channel": True, "user": True}))
+
+    @message_stage(100)
+    async def model_listener(self, mc: MessageContext):
+        '''
+        Updates the stored text model of the author in the channel
+        '''
+        message = mc.message
+        if message.content and \
+                (key := (message.channel.id, message.author.id)) in stored:
+            learn(key, message.content)
+
     @commands.command()
     @commands.guild_only()
     async def gen(self, ctx: commands.Context,
@@ -99,10 +233,10 @@ class Textgen(commands.Cog):
         '''
         Generates text from model of a user and outputs it.
         Text is based on the user's 100 most recent messages in
-        the specified channel.
+        the specified channel, and everything they have said since.
 
         Please note that the first runthrough takes a bit longer,
-        as it must cache all of the messages sent by the user.
+        as it must read the messages sent by the user.
         '''
         if not member:
             member = ctx.author
@@ -110,8 +244,9 @@ class Textgen(commands.Cog):
             channel = ctx.channel
 
         m = None
-        # We want to check if our model is cached
-        if not [channel.id, member.id] in list(text_model._cache.keys()):
+        # We want to check if our model needs to read the channel history
+        if (channel.id, member.id) not in stored and \
+                (channel.id, member.id) not in models:
             t_start = time.perf_counter()
             m = await ctx.send(
                 f"Building model for {member.display_name}..."
@@ -119,7 +254,7 @@ class Textgen(commands.Cog):
                 "model will be cached after.)")
             await ctx.trigger_typing()
 
-        model: dict = await text_model(channel.id, member.id)
+        model: TextModel = await text_model(channel.id, member.id)
 
         if m:
             t_ = time.perf_counter() - t_start
@@ -129,7 +264,7 @@ class Textgen(commands.Cog):
                          f"built in {round(t_)} s"),
                 delete_after=5)
 
-        text = generate_text(model, 200)
+        text = model.generate(200)
 
         if text:
             await echo(ctx, member, text)
@@ -166,6 +301,7 @@ class Textgen(commands.Cog):
         '''
         Shows status of LRU cache
         '''
-        await ctx.send(text_model.cache_info())
+        await ctx.send(f"Models cached: {len(models)}/{MODEL_LIMIT}, "
+                       f"stored: {len(stored)}, "
+                       f"with unsaved messages: {len(pending)}")
 
-# TODO: Background generation of models?
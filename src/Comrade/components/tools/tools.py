@@ -18,9 +18,11 @@ from bs4 import BeautifulSoup
 from PyDictionary import PyDictionary
 import urllib.request
 from utils.utilities import webscrape_header, local_time
-from utils.echo import echo
+from utils.echo import echo, fan_out
+from utils.outbound import outbound
 from utils.logger import logger
-from db import collection
+from db import collection, server_cfg as get_server_cfg
+from client import message_stage, MessageContext, prefix
 from discord_components import Button, ButtonStyle, InteractionType
 
 REACTIONS = "abcdefghijklmnopqrstuvwxyz"
@@ -185,16 +187,15 @@ class Tools(commands.Cog):
 
         await ctx.send(file=discord.File(f, "renderedtex.png"))
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
+    @message_stage(50, triggers=[prefix("==")])
+    async def inline_calculator(self, mc: MessageContext):
         '''
         Inline calculator
         '''
+        message = mc.message
         if message.content and \
                 not message.author.bot and message.content[:2] == "==":
-            await self.calculate(
-                await self.bot.get_context(message),
-                expression=message.content[2:])
+            await self.calculate(mc.ctx, expression=message.content[2:])
 
     @commands.command()
     async def news(self, ctx: commands.Context, *, content):
@@ -443,7 +444,7 @@ class Tools(commands.Cog):
         '''
         await ctx.trigger_typing()
 
-        server_cfg: dict = collection("servers").find_one(ctx.guild.id)
+        server_cfg: dict = get_server_cfg(ctx.guild.id)
 
         try:
             custom_group = server_cfg["channels"]["custom"]
@@ -500,16 +501,25 @@ class Tools(commands.Cog):
             if not webhook:
                 webhook = await destination.create_webhook(name="ChannelCopier", avatar=None)
 
-            async for message in source.history(limit=None, oldest_first=True):
-                m = await webhook.send(wait=True, content=message.content, username=message.author.display_name, avatar_url=message.author.avatar_url, embeds=message.embeds, files=[await a.to_file() for a in message.attachments])
+            async def download(message):
+                return await asyncio.gather(
+                    *(a.to_file() for a in message.attachments))
+
+            async def copy(message, files):
+                m = await outbound.send(webhook, wait=True, content=message.content, username=message.author.display_name, avatar_url=message.author.avatar_url, embeds=message.embeds, files=files)
                 for r in message.reactions:
-                    await m.add_reaction(r)
+                    outbound.react(m, r)
+                    # queued, so that the next message does not wait
+
+            # messages are sent in order, with attachments downloaded ahead
+            report = await fan_out(
+                source.history(limit=None, oldest_first=True), copy, download)
 
         except asyncio.TimeoutError:
             await ctx.send("Tranfer aborted.")
         else:
             await ctx.send(
-                f"Transfer from {source.mention} to {destination.mention} completed successfully.")
+                f"Transfer from {source.mention} to {destination.mention} completed successfully. {report}")
 
     @commands.command()
     @commands.guild_only()
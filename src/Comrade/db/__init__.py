@@ -1,6 +1,15 @@
-from .mongodb import startup as mongo_startup, collection
+from .mongodb import (startup as mongo_startup, collection,
+                      async_collection, AsyncCollection)
+from .cache import (server_cfg, update_server_cfg, load_server_cfgs,
+                    cache_server_cfg, drop_server_cfg, watch_server_cfgs,
+                    user_profile, update_user_profile, drop_user_profiles,
+                    profiles as profile_cache)
 from .relay import get_relay_guild as relay_guild, get_relay_channel as relay_channel, RELAY_ID, emote_channel, startup as relay_startup
 
-__all__ = ["collection", "mongo_startup", 
-           "relay_guild", "relay_channel",
-           "RELAY_ID", "relay_startup", "emote_channel"]
+__all__ = ["collection", "async_collection", "AsyncCollection",
+           "mongo_startup", "relay_guild", "relay_channel",
+           "RELAY_ID", "relay_startup", "emote_channel",
+           "server_cfg", "update_server_cfg", "load_server_cfgs",
+           "cache_server_cfg", "drop_server_cfg", "watch_server_cfgs",
+           "user_profile", "update_user_profile", "drop_user_profiles",
+           "profile_cache"]
@@ -0,0 +1,191 @@
+'''
+In-process caches in front of frequently read MongoDB collections
+'''
+import time
+from threading import Thread
+from collections import OrderedDict
+from pymongo import ReturnDocument
+
+from config import cfg
+from utils.logger import logger
+from .mongodb import collection, async_collection
+
+# guild id -> server configuration document
+server_cfgs: dict = {}
+
+
+class ProfileCache:
+    '''
+    Bounded LRU cache of user documents keyed by (server, user),
+    where each entry also expires after a fixed time-to-live
+    '''
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expiry, document)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> dict:
+        if (entry := self.entries.get(key)) and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.entries.pop(key, None)  # expired
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, document: dict):
+        self.entries[key] = (time.monotonic() + self.ttl, document)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)  # least recently used
+
+    def evict(self, key: tuple):
+        self.entries.pop(key, None)
+
+    def evict_where(self, server: int = None, user: int = None):
+        '''
+        Evicts every entry belonging to a server and/or a user
+        '''
+        for key in [k for k in self.entries if (
+                server is None or k[0] == server) and (
+                    user is None or k[1] == user)]:
+            del self.entries[key]
+
+    def info(self) -> str:
+        total = self.hits + self.misses
+        return (f"ProfileCache(hits={self.hits}, misses={self.misses}, "
+                f"hit_rate={round(self.hits / total * 100, 1) if total else 0}%, "
+                f"size={len(self.entries)}/{self.maxsize}, ttl={self.ttl}s)")
+
+
+profiles = ProfileCache(
+    int(cfg["Performance"].get("user-cache-size", "4096")),
+    float(cfg["Performance"].get("user-cache-ttl", "600")))
+
+
+def profile_key(member) -> tuple:
+    '''
+    Cache key equivalent of ufil(member)
+    '''
+    return member.guild.id, member.id
+
+
+def load_server_cfgs(documents):
+    '''
+    Fills the server configuration cache from a set of documents,
+    typically every document in the servers collection at startup
+    '''
+    for document in documents:
+        server_cfgs[document["_id"]] = document
+
+
+def cache_server_cfg(document: dict):
+    '''
+    Stores a single (new or updated) server configuration in the cache
+    '''
+    server_cfgs[document["_id"]] = document
+
+
+def drop_server_cfg(guild_id: int):
+    '''
+    Removes a server configuration from the cache
+    '''
+    server_cfgs.pop(guild_id, None)
+
+
+def server_cfg(guild_id: int) -> dict:
+    '''
+    Returns the configuration of a server.
+    Served from memory; only goes to the database if the server
+    was not loaded during startup.
+    Treat the returned document as read-only.
+    '''
+    if (document := server_cfgs.get(guild_id)) is None:
+        if document := collection("servers").find_one(guild_id):
+            server_cfgs[guild_id] = document
+    return document
+
+
+async def update_server_cfg(guild_id: int, update: dict) -> dict:
+    '''
+    Applies an update to a server configuration in the database,
+    and writes the resulting document through to the cache
+    '''
+    document = await async_collection("servers").find_one_and_update(
+        {"_id": guild_id}, update, return_document=ReturnDocument.AFTER)
+
+    if document:
+        server_cfgs[guild_id] = document
+    return document
+
+
+async def user_profile(member) -> dict:
+    '''
+    Returns the user document of a server member.
+    Served from memory when cached; treat it as read-only.
+    '''
+    key = profile_key(member)
+
+    if (document := profiles.get(key)) is None:
+        document = await async_collection("users").find_one(
+            {"user": key[1], "server": key[0]})
+
+        # a write may have landed in the cache while we were waiting
+        if entry := profiles.entries.get(key):
+            document = entry[1]
+        elif document:
+            profiles.put(key, document)
+    return document
+
+
+async def update_user_profile(member, update: dict) -> dict:
+    '''
+    Applies an update to a user document in the database,
+    and writes the resulting document through to the cache
+    '''
+    key = profile_key(member)
+
+    if document := await async_collection("users").find_one_and_update(
+            {"user": key[1], "server": key[0]}, update,
+            return_document=ReturnDocument.AFTER):
+        profiles.put(key, document)
+    else:
+        profiles.evict(key)
+    return document
+
+
+def drop_user_profiles(server: int = None, user: int = None):
+    '''
+    Invalidates cached user documents after writes which bypass
+    update_user_profile (bulk updates, deletes)
+    '''
+    profiles.evict_where(server, user)
+
+
+def watch_server_cfgs():
+    '''
+    Keeps the server configuration cache in sync with writes made
+    by other processes, using a MongoDB change stream.
+    Requires a replica set (eg. MongoDB Atlas).
+    '''
+    def watch():
+        try:
+            with collection("servers").watch(
+                    full_document="updateLookup") as stream:
+                for change in stream:
+                    if change["operationType"] == "delete":
+                        drop_server_cfg(change["documentKey"]["_id"])
+                    elif document := change.get("fullDocument"):
+                        cache_server_cfg(document)
+        except Exception:
+            logger.exception("Server configuration change stream stopped")
+
+    if cfg["Performance"].get("server-change-stream", "False") == "True":
+        listener = Thread(target=watch)
+        listener.daemon = True
+        listener.start()
+        logger.info("Listening for server configuration changes.")
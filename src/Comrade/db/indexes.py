@@ -0,0 +1,113 @@
+'''
+Declarative index schema for Comrade's MongoDB collections.
+Collections are referred to by the same names as in the [MongoDB]
+section of the configuration file.
+'''
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from utils.logger import logger
+
+# name in cfg["MongoDB"] -> indexes to ensure, and the query shapes
+# the code runs against that collection (values are placeholders)
+SCHEMA = {
+    "users": {
+        "indexes": [
+            [("server", ASCENDING), ("user", ASCENDING)],
+            [("server", ASCENDING), ("OP", ASCENDING)],
+            [("server", ASCENDING), ("moderation.threat-level", ASCENDING)],
+            [("user", ASCENDING)]
+        ],
+        "queries": [
+            {"server": 0, "user": 0},
+            {"server": 0, "OP": True},
+            {"server": 0, "moderation.threat-level": {"$gt": 0}},
+            {"user": 0}
+        ]
+    },
+    "emotes": {
+        "indexes": [
+            [("server", ASCENDING), ("name", ASCENDING)],
+            [("server", ASCENDING), ("lowercase-name", ASCENDING)],
+            [("server", ASCENDING), ("type", ASCENDING), ("name", ASCENDING)],
+            [("server", ASCENDING), ("phash-bands", ASCENDING)]
+        ],
+        "queries": [
+            {"server": 0, "name": ""},
+            {"server": 0, "lowercase-name": ""},
+            {"server": 0, "type": "big"},
+            {"server": 0, "phash-bands": {"$in": [0]}}
+        ]
+    },
+    "macros": {
+        "indexes": [[("server", ASCENDING), ("name", ASCENDING)]],
+        "queries": [{"server": 0, "name": ""}]
+    },
+    "lists": {
+        "indexes": [[("server", ASCENDING), ("name", ASCENDING)]],
+        "queries": [{"server": 0, "name": ""}]
+    },
+    "textmodels": {
+        "indexes": [[("channel", ASCENDING), ("user", ASCENDING)]],
+        "queries": [{"channel": 0, "user": 0}]
+    },
+    "reminders": {
+        "indexes": [[("time", ASCENDING)]],
+        "queries": [{"time": {"$lte": 0}}]
+    },
+    "announcements": {
+        "indexes": [[("server", ASCENDING), ("owner", ASCENDING)]],
+        "queries": [{"server": 0, "owner": 0}]
+    },
+    "favouritensfw": {
+        "indexes": [
+            [("server", ASCENDING), ("user", ASCENDING),
+             ("imageID", ASCENDING)],
+            [("server", ASCENDING), ("user", ASCENDING),
+             ("category", ASCENDING)]
+        ],
+        "queries": [
+            {"server": 0, "user": 0, "imageID": ""},
+            {"server": 0, "user": 0, "category": ""}
+        ]
+    }
+}
+
+
+def winning_stages(plan: dict):
+    '''
+    Yields the names of every stage in an explained query plan
+    '''
+    yield plan.get("stage")
+    for child in plan.get("inputStages", []) + [
+            plan[k] for k in ("inputStage", "queryPlan") if k in plan]:
+        yield from winning_stages(child)
+
+
+def ensure_indexes(collection):
+    '''
+    Creates any missing indexes declared in the schema, and reports
+    declared queries which would still be answered by a collection scan.
+    collection is the name -> Collection lookup from db.mongodb
+    '''
+    for name, schema in SCHEMA.items():
+        if (col := collection(name)) is None:
+            continue
+
+        try:
+            col.create_indexes([IndexModel(keys)
+                                for keys in schema["indexes"]])
+        except PyMongoError:
+            logger.exception(f"Could not create indexes on {col.name}")
+
+        for query in schema["queries"]:
+            try:
+                plan = col.find(query).explain()["queryPlanner"]
+            except PyMongoError:
+                continue
+
+            if "COLLSCAN" in winning_stages(plan["winningPlan"]):
+                logger.warning(f"Collection scan on {col.name} for "
+                               f"query shape {list(query)}")
+
+    logger.info("MongoDB indexes ensured")
@@ -3,15 +3,25 @@ MongoDB Database for Comrade
 '''
 import sys
 import os
+import asyncio
+import functools
 import pymongo
 from pymongo.collection import Collection
+from concurrent.futures import ThreadPoolExecutor
 
 from config import cfg
 from utils.logger import logger
+from .indexes import ensure_indexes
 
 mongo_client = None
 db = None
 
+# Dedicated thread pool for database I/O, so that blocking pymongo calls
+# never run directly on the discord.py event loop
+executor = ThreadPoolExecutor(
+    max_workers=int(cfg["Performance"].get("mongo-threads", "8")),
+    thread_name_prefix="mongo")
+
 
 def startup():
     '''
@@ -32,6 +42,8 @@ def startup():
     logger.info("MongoDB Atlas connected to: "
                 f"{mongo_client.list_database_names()[0]}")
 
+    ensure_indexes(collection)
+
 
 # Convenience method to return collection by name in configuration
 def collection(name) -> Collection:
@@ -39,3 +51,71 @@ def collection(name) -> Collection:
         return db[cfg["MongoDB"][name]]
     except Exception:
         return None
+
+
+class AsyncCollection:
+    '''
+    Awaitable wrapper around a pymongo collection.
+    Every operation is run on the database thread pool,
+    so awaiting it yields to the event loop instead of blocking it.
+
+    Mirrors the pymongo method names, except that
+    find and aggregate return lists instead of cursors.
+    '''
+    def __init__(self, sync_collection: Collection):
+        self.sync = sync_collection
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(
+            executor, functools.partial(fn, *args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return await self._run(self.sync.find_one, *args, **kwargs)
+
+    async def find(self, *args, **kwargs) -> list:
+        # Cursors do network I/O while iterating, so exhaust them off-loop
+        return await self._run(
+            lambda: list(self.sync.find(*args, **kwargs)))
+
+    async def aggregate(self, pipeline, **kwargs) -> list:
+        return await self._run(
+            lambda: list(self.sync.aggregate(pipeline, **kwargs)))
+
+    async def count_documents(self, *args, **kwargs) -> int:
+        return await self._run(self.sync.count_documents, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._run(self.sync.insert_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._run(self.sync.insert_many, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._run(self.sync.update_one, *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._run(self.sync.update_many, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._run(
+            self.sync.find_one_and_update, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._run(self.sync.delete_one, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._run(self.sync.delete_many, *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self._run(self.sync.bulk_write, *args, **kwargs)
+
+
+def async_collection(name) -> AsyncCollection:
+    '''
+    Awaitable counterpart of collection().
+    Cogs can move over to this one call site at a time;
+    both share the same underlying client.
+    '''
+    if (sync_collection := collection(name)) is not None:
+        return AsyncCollection(sync_collection)
+    return None
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, send_file, redirect, url_for
+from flask import Flask, render_template, send_file, redirect, url_for, abort
 # used to create web server to keep bot actively hosted
 from threading import Thread
 # used to create separate parallel process to keep bot up
@@ -6,10 +6,12 @@ from threading import Thread
 from flask_discord import DiscordOAuth2Session, requires_authorization, Unauthorized
 
 import os
+import io
 import secrets
 
 from utils.utilities import get_uptime
 from utils.logger import logger
+from utils.blob_cache import emote_cache
 from client import client as bot
 import datetime
 from config import version, cfg
@@ -84,11 +86,21 @@ def emotegallery():
         for emote in collection("emotes").find({"server": g.id}):
             if len(emote_urls[-1]) >= 6:
                 emote_urls.append({})
-            emote_urls[-1][emote["name"]] = (emote["URL"], g.name, emote["type"])
+            url = url_for("emoteimage", digest=emote["hash"], ext=emote["ext"]) \
+                if emote.get("hash") in emote_cache.entries else emote["URL"]
+            # served from the emote cache when possible
+            emote_urls[-1][emote["name"]] = (url, g.name, emote["type"])
 
     return render_template("emotegallery.html", images=emote_urls, username=user.name)
 
 
+@app.route("/emote/<digest>.<ext>")
+def emoteimage(digest, ext):
+    if (data := emote_cache.read(digest)) is None:
+        abort(404)
+    return send_file(io.BytesIO(data), mimetype=f"image/{ext}")
+
+
 def run():
     app.run(host="0.0.0.0", port=8080)
 
@@ -1,14 +1,15 @@
 import time
 import dotenv
 import os
+import asyncio
 
 import components
-from client import client as bot
+from client import client as bot, pipeline
 from config import cfg, version
-from utils.utilities import set_start_time, get_uptime
+from utils.utilities import set_start_time, get_uptime, monitor_loop_lag
 from utils.databases import rebuild_server_cfgs
 from utils.users import rebuild_weight_table, sum_of_weights
-from db import mongo_startup, RELAY_ID, relay_startup
+from db import mongo_startup, watch_server_cfgs, RELAY_ID, relay_startup
 from hosting import keep_alive
 from utils.logger import logger
 
@@ -20,9 +21,14 @@ dotenv.load_dotenv()  # Load .env file, prior to components loading
 # Startup operations
 set_start_time(time.perf_counter())
 mongo_startup()
+watch_server_cfgs()
 
 for c in components.cogs:
-    bot.add_cog(c(bot))
+    cog = c(bot)
+    bot.add_cog(cog)
+    pipeline.add_cog(cog)
+
+bot.loop.create_task(monitor_loop_lag())
 
 
 @bot.event
@@ -39,7 +45,8 @@ async def on_ready():
     '''
     Message cache etc. is ready
     '''
-    rebuild_server_cfgs([guild for guild in bot.guilds if guild.id != RELAY_ID])
+    await rebuild_server_cfgs(
+        [guild for guild in bot.guilds if guild.id != RELAY_ID])
     await relay_startup(bot)
 
     logger.info("Server List:\n" +
@@ -76,7 +83,26 @@ async def on_ready():
 if cfg["Hosting"]["ping"] == "True":
     keep_alive()
 
+
+async def run():
+    '''
+    Runs the bot with the loaded password,
+    waiting longer each time logging in is rate limited
+    '''
+    delay = 5
+    while True:
+        try:
+            await bot.start(os.environ.get("TOKEN"))
+            return
+        except HTTPException as e:
+            if e.status != 429:
+                raise
+            logger.warning(f"Rate limited while logging in, "
+                           f"retrying in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 600)
+
 try:
-    bot.run(os.environ.get("TOKEN"))  # Run bot with loaded password
-except HTTPException:
-    os.system("kill 1")  # hard restart on 429
+    bot.loop.run_until_complete(run())
+except KeyboardInterrupt:
+    bot.loop.run_until_complete(bot.close())
@@ -1,5 +1,6 @@
 from . import echo
 from . import emoji_converter
+from . import normalizer
 from . import reactions
 from . import users
 from . import utilities
@@ -7,7 +8,11 @@ from . import checks
 from . import logger
 from . import databases
 from . import button_menu
+from . import blob_cache
+from . import outbound
+from . import markov
 
-__all__ = ["echo", "emoji_converter", "reactions",
+__all__ = ["echo", "emoji_converter", "normalizer", "reactions",
            "users", "utilities", "checks", "logger",
-           "databases", "button_menu"]
+           "databases", "button_menu", "blob_cache",
+           "outbound", "markov"]
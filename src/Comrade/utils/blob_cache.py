@@ -0,0 +1,175 @@
+'''
+Comrade - Blob Cache
+Size-bounded cache of files on disk, named by the hash of their content.
+Used for emote images, so that they are not downloaded again on every use.
+'''
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import cfg
+from utils.logger import logger
+
+DIGEST = re.compile(r"[0-9a-f]{32}")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class BlobCache:
+    '''
+    Files named by the hash of their content, evicting the least recently
+    used ones once they take up more than a number of bytes.
+    Thread safe, since the web server reads from it as well.
+    '''
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # digest -> size, least recent first
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # access times survive restarts as modification times
+        files = []
+        for entry in os.scandir(directory):
+            if DIGEST.fullmatch(entry.name):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+            elif entry.name.endswith(".tmp"):
+                os.remove(entry.path)  # interrupted write
+
+        for _, digest, size in sorted(files):
+            self.entries[digest] = size
+            self.size += size
+        self.remove(self.evict())  # the size limit may have changed
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def evict(self) -> list:
+        '''
+        Drops entries until the cache fits its size limit,
+        returning their digests. Must hold the lock.
+        '''
+        evicted = []
+        while self.size > self.max_bytes:
+            digest, size = self.entries.popitem(last=False)
+            self.size -= size
+            evicted.append(digest)
+        self.evictions += len(evicted)
+        return evicted
+
+    def remove(self, digests: list):
+        for digest in digests:
+            try:
+                os.remove(self.path(digest))
+            except OSError:
+                pass
+
+    def read(self, digest: str) -> bytes:
+        '''
+        Returns the content with a hash, or None if it is not cached
+        '''
+        with self.lock:
+            if digest not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+
+        try:
+            with open(path := self.path(digest), "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # evicted while reading, or deleted from outside
+            with self.lock:
+                if (size := self.entries.pop(digest, None)) is not None:
+                    self.size -= size
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def write(self, data: bytes) -> str:
+        '''
+        Stores content, returning its hash
+        '''
+        digest = content_hash(data)
+
+        with self.lock:
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                return digest
+        if len(data) > self.max_bytes:
+            return digest
+
+        # written whole or not at all
+        temp = f"{self.path(digest)}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, self.path(digest))
+
+        with self.lock:
+            if digest not in self.entries:
+                self.entries[digest] = len(data)
+                self.size += len(data)
+            evicted = self.evict()
+        self.remove(evicted)
+        return digest
+
+    async def get(self, digest: str) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.read, digest)
+
+    async def put(self, data: bytes) -> str:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.write, data)
+
+    async def fetch(self, session, url: str, digest: str = None) -> tuple:
+        '''
+        Returns the content at a url and its hash,
+        reading it from the cache if the hash is known and cached
+        '''
+        if digest and (data := await self.get(digest)) is not None:
+            return data, digest
+
+        if not digest:
+            with self.lock:
+                self.misses += 1
+
+        async with session.get(url) as resp:
+            data = await resp.read()
+            if resp.status != 200:
+                return data, None  # error pages are not cached
+
+        try:
+            return data, await self.put(data)
+        except OSError as e:
+            logger.error(f"Could not cache {url}: {e}")
+            return data, content_hash(data)
+
+    def info(self) -> str:
+        total = self.hits + self.misses
+        return (f"BlobCache(hits={self.hits}, misses={self.misses}, "
+                f"hit_rate={round(self.hits / total * 100, 1) if total else 0}%, "
+                f"files={len(self.entries)}, "
+                f"size={round(self.size / 2**20, 1)}/"
+                f"{round(self.max_bytes / 2**20, 1)} MB, "
+                f"evictions={self.evictions})")
+
+
+emote_cache = BlobCache(
+    cfg["Performance"].get("emote-cache-dir", "emote_cache"),
+    int(float(cfg["Performance"].get("emote-cache-size", "256")) * 2**20))
@@ -1,25 +1,39 @@
-import discord
 from discord.ext import commands
 from discord_components import Button, ButtonStyle, InteractionType
 import asyncio
 
 
-async def send_menu(ctx: commands.context, embeds: discord.Embed):
+async def send_menu(ctx: commands.context, pages, num_pages: int = None,
+                    start: int = 0):
     '''
-    Send embeds with buttons for navigation
+    Send embeds with buttons for navigation.
+    Pages are either a list of embeds, or a page provider: a coroutine
+    function returning the embed of a page number, called only when
+    the page is shown (the number of pages must then be given).
     '''
-    current_page = 0  # Index
-    last_page = len(embeds) - 1  # Last allowable index
+    if not callable(pages):
+        embeds = pages
+        num_pages = len(embeds)
 
-    if len(embeds) == 1:
-        await ctx.send(embed=embeds[0])
+        async def pages(page):
+            return embeds[page]
+
+    if not num_pages:
+        return  # nothing to show
+
+    last_page = num_pages - 1  # Last allowable index
+    current_page = min(max(start, 0), last_page)  # Index
+
+    if num_pages == 1:
+        await ctx.send(embed=await pages(0))
         return
 
     def components(current_page):
         return[[Button(label="Previous", style=ButtonStyle.blue, emoji="◀", disabled=(current_page == 0)),
                 Button(label="Next", style=ButtonStyle.blue, emoji="▶", disabled=(current_page == last_page))]]
 
-    msg = await ctx.send(embed=embeds[0], components=components(current_page))
+    msg = await ctx.send(embed=await pages(current_page),
+                         components=components(current_page))
 
     while 1:
 
@@ -36,7 +50,7 @@ async def send_menu(ctx: commands.context, embeds: discord.Embed):
 
             await res.respond(type=InteractionType.UpdateMessage,
                               components=components(current_page),
-                              embed=embeds[current_page])
+                              embed=await pages(current_page))
 
         except asyncio.TimeoutError:
             await msg.edit(components=[])
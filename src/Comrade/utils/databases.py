@@ -3,8 +3,10 @@ Utilities related to databases
 '''
 
 import discord
+import time
 
-from db import collection
+from db import (async_collection, server_cfg, load_server_cfgs,
+                drop_server_cfg, drop_user_profiles)
 from config import cfg
 from utils.logger import logger
 
@@ -59,16 +61,17 @@ def new_server(guild: discord.Guild):
     }
 
 
-def new_user(user: discord.Member):
+def new_user(user: discord.Member, config: dict = None):
     '''
     Configures a new user for use, returns a dictionary ready to be updated
+    Pass in the server configuration when creating users in bulk
     '''
+    if config is None:
+        config = server_cfg(user.guild.id)
 
     # Attempt to set default daily count
-    server_cfg: dict = collection("servers").find_one(user.guild.id)
-
     if not user.bot or cfg["Settings"]["exclude-bots-from-daily"] == "False":
-        daily = server_cfg["default-daily-count"]
+        daily = config["default-daily-count"]
     else:
         daily = 0
 
@@ -99,56 +102,76 @@ def new_user(user: discord.Member):
     }
 
 
-def rebuild_server_cfgs(guilds: list):
+async def rebuild_server_cfgs(guilds: list):
     '''
     Rebuilds server configuration
     '''
     logger.info("Scanning for new servers...")
+    t_start = time.perf_counter()
+
+    DB_guilds = await async_collection("servers").find()
+    load_server_cfgs(DB_guilds)  # warm the configuration cache
+
+    guild_ids = {g["_id"] for g in DB_guilds}
 
-    DB_guilds = collection("servers").find()
+    actual_guilds = {g.id: g for g in guilds}
 
-    guild_ids = [g["_id"] for g in DB_guilds]
+    if new_ids := actual_guilds.keys() - guild_ids:
+        documents = [new_server(actual_guilds[g_id]) for g_id in new_ids]
+        logger.info("New Servers Found: " + ", ".join(
+            actual_guilds[g_id].name for g_id in new_ids))
 
-    actual_guild_ids = [g.id for g in guilds]
+        await async_collection("servers").insert_many(documents)
+        load_server_cfgs(documents)
 
     for guild in guilds:
-        if guild.id not in guild_ids:
-            logger.info(f"New Server Found: {guild.name}")
-            collection("servers").insert_one(new_server(guild))
-        rebuild_user_profiles(guild)  # check users too
+        await rebuild_user_profiles(guild)  # check users too
 
-    for g_id in guild_ids:
-        if g_id not in actual_guild_ids and \
-                cfg["Settings"]["development-mode"] == "False":
-            logger.info("Deleting Old Server & Members")
-            collection("servers").delete_one({"_id": g_id})
-            collection("users").delete_many({"server": g_id})
+    if (old_ids := list(guild_ids - actual_guilds.keys())) and \
+            cfg["Settings"]["development-mode"] == "False":
+        logger.info(f"Deleting {len(old_ids)} Old Server(s) & Members")
+        await async_collection("servers").delete_many(
+            {"_id": {"$in": old_ids}})
+        await async_collection("users").delete_many(
+            {"server": {"$in": old_ids}})
 
-    logger.info("Server scan DONE")
+        for g_id in old_ids:
+            drop_server_cfg(g_id)
+            drop_user_profiles(server=g_id)
 
+    logger.info("Server scan DONE in "
+                f"{round((time.perf_counter() - t_start) * 1000)} ms")
 
-def rebuild_user_profiles(guild: discord.Guild):
+
+async def rebuild_user_profiles(guild: discord.Guild):
     '''
     Rebuilds user profiles within a given server
     '''
-    logger.info(f"{guild.name}: Scanning for new members...")
+    t_start = time.perf_counter()
+
+    DB_members = await async_collection("users").find(
+        {"server": guild.id}, {"user": True, "_id": False})
 
-    DB_members = collection("users").find({"server": guild.id})
+    member_ids = {m["user"] for m in DB_members}
 
-    member_ids = [m["user"] for m in DB_members]
+    actual_members = {m.id: m for m in guild.members}
 
-    actual_member_ids = [m.id for m in guild.members]
+    # Add new, fetching the server configuration only once
+    if new_ids := actual_members.keys() - member_ids:
+        config = server_cfg(guild.id)
+        await async_collection("users").insert_many(
+            [new_user(actual_members[mem_id], config) for mem_id in new_ids],
+            ordered=False)
 
-    # Scan to add new
-    for member in guild.members:
-        if member.id not in member_ids:
-            logger.info(f"New Member Found in {guild.name}")
-            collection("users").insert_one(new_user(member))
+    # Remove old
+    if (old_ids := list(member_ids - actual_members.keys())) and \
+            cfg["Settings"]["development-mode"] == "False":
+        await async_collection("users").delete_many(
+            {"server": guild.id, "user": {"$in": old_ids}})
+        drop_user_profiles(server=guild.id)
+    else:
+        old_ids = []
 
-    # Scan to remove old
-    for mem_id in member_ids:
-        if mem_id not in actual_member_ids and \
-                cfg["Settings"]["development-mode"] == "False":
-            logger.info(f"Deleting Old Member Found in {guild.name}")
-            collection("users").delete_one(
-                {"server": guild.id, "user": mem_id})
+    logger.info(f"{guild.name}: Member scan added {len(new_ids)}, "
+                f"removed {len(old_ids)} of {len(actual_members)} members in "
+                f"{round((time.perf_counter() - t_start) * 1000)} ms")
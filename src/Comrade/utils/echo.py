@@ -6,6 +6,64 @@ allows messsages to be sent under the guise of another person
 import discord
 from discord.ext import commands
 
+import time
+import asyncio
+from collections import defaultdict
+
+from config import cfg
+from utils.logger import logger
+from utils.outbound import outbound
+
+FAN_OUT_LIMIT = int(cfg["Performance"].get("fan-out-limit", "5"))
+# messages prepared or sent at the same time by fan_out
+
+
+class WebhookRegistry:
+    '''
+    Webhook used to mimic in each channel, keyed by channel id.
+    Found or created on first use, and dropped when it stops working
+    or the channel's webhooks change.
+    '''
+    def __init__(self):
+        self.webhooks = {}  # channel id -> webhook
+        self.locks = defaultdict(asyncio.Lock)
+        # channel id -> lock, so that only one webhook is created
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, channel: discord.TextChannel) -> discord.Webhook:
+        if webhook := self.webhooks.get(channel.id):
+            self.hits += 1
+            return webhook
+
+        async with self.locks[channel.id]:
+            # another mimic may have found it while we were waiting
+            if not (webhook := self.webhooks.get(channel.id)):
+                self.misses += 1
+
+                # Set up webhook if it doesn't already exist
+                if not (webhook := discord.utils.find(
+                        lambda w: w.name == "Comrade" and w.token,
+                        await channel.webhooks())):
+                    webhook = await channel.create_webhook(name="Comrade",
+                                                           avatar=None,
+                                                           reason="Comrade "
+                                                           "Mimic System")
+                self.webhooks[channel.id] = webhook
+        return webhook
+
+    def drop(self, channel_id: int):
+        self.webhooks.pop(channel_id, None)
+
+    def info(self) -> str:
+        total = self.hits + self.misses
+        return (f"WebhookRegistry(hits={self.hits}, misses={self.misses}, "
+                f"hit_rate={round(self.hits / total * 100, 1) if total else 0}%, "
+                f"channels={len(self.webhooks)})")
+
+
+webhooks = WebhookRegistry()
+
 
 async def mimic(channel: discord.TextChannel, content=None,
                 username=None, avatar_url: str = None, **kwargs):
@@ -13,25 +71,24 @@ async def mimic(channel: discord.TextChannel, content=None,
     Sends a mimic message in a channel using a webhook,
     allowing the bot to use a different name, and avatar
     '''
-    # Set up webhook if it doesn't already exist
-    # if there are no webhook permissions, send it directly using the bot
-    try:
-        if not (webhook := discord.utils.get(await channel.webhooks(),
-                                             name="Comrade")):
-            webhook = await channel.create_webhook(name="Comrade",
-                                                   avatar=None,
-                                                   reason="Comrade "
-                                                   "Mimic System")
-    except BaseException:
-        await channel.send(content=content,
-                           username=username,
-                           avatar_url=avatar_url,
-                           **kwargs)
-        return
-
-    await webhook.send(content=content,
-                       username=username,
-                       avatar_url=avatar_url, **kwargs)
+    for retry in (True, False):
+        try:
+            webhook = await webhooks.get(channel)
+        except BaseException:
+            # if there are no webhook permissions, send it directly using the bot
+            await outbound.send(channel, content=content, **kwargs)
+            return
+
+        try:
+            await outbound.send(webhook, content=content,
+                                username=username,
+                                avatar_url=avatar_url, **kwargs)
+            return
+        except discord.NotFound:
+            # the webhook was deleted since it was cached
+            webhooks.drop(channel.id)
+            if not retry:
+                raise
 
 
 async def echo(ctx: commands.Context, member=discord.Member,
@@ -46,6 +103,76 @@ async def echo(ctx: commands.Context, member=discord.Member,
         await ctx.message.delete()  # deletes the source message
 
 
+async def iterate(items):
+    '''
+    Iterates over an iterable or an async iterable (eg. channel history)
+    '''
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def fan_out(items, send, prepare=None, limit: int = FAN_OUT_LIMIT,
+                  ordered: bool = True) -> str:
+    '''
+    Sends a message for each of many items, returning a throughput report.
+    Items are prepared (eg. attachments downloaded) up to a number at a time,
+    ahead of being sent with send(item, prepared).
+    Ordered items are sent one at a time, in order;
+    others are sent as soon as they are prepared.
+    '''
+    async def step(item):
+        prepared = await prepare(item) if prepare else None
+        if not ordered:
+            await send(item, prepared)
+        return item, prepared
+
+    window = asyncio.Queue()
+    # tasks in flight, in the order of the items
+    slots = asyncio.Semaphore(limit)
+
+    async def produce():
+        try:
+            async for item in iterate(items):
+                await slots.acquire()
+                await window.put(asyncio.ensure_future(step(item)))
+        finally:
+            await window.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    start = time.perf_counter()
+    sent = failed = 0
+
+    try:
+        while (task := await window.get()) is not None:
+            try:
+                item, prepared = await task
+                if ordered:
+                    await send(item, prepared)
+                sent += 1
+            except Exception as e:
+                failed += 1
+                logger.error("Could not send a message", exc_info=e)
+            finally:
+                slots.release()
+
+        await producer  # raises if the items could not be read
+    finally:
+        # stop sending if the command was cancelled or failed
+        producer.cancel()
+        while not window.empty():
+            if task := window.get_nowait():
+                task.cancel()
+
+    elapsed = time.perf_counter() - start
+    return (f"Sent {sent} messages in {round(elapsed, 1)}s "
+            f"({round(sent / elapsed, 2) if elapsed else sent}/s)"
+            + (f", {failed} failed" if failed else ""))
+
+
 def isWebhook(message: discord.Message) -> bool:
     # Checks if it's a webhook
     return message.author.discriminator == "0000"
@@ -2,6 +2,15 @@
 Comrade - Emoji Converter
 Turns text into emoji and vice versa
 '''
+import re
+
+
+REGIONAL_INDICATOR = re.compile("([\U0001F1E6-\U0001F1FF]).?", re.DOTALL)
+# a regional indicator letter, and the character following it
+
+
+def _indicator_to_letter(match) -> str:
+    return chr(ord(match.group(1)) - 0x1F1E6 + ord("a"))
 
 
 def emojiToText(s) -> str:
@@ -9,56 +18,7 @@ def emojiToText(s) -> str:
     Converts emoji to closest real text representation (lowercase output)
     Note: Will strip spaces.
     '''
-    lookupTable = {
-        u"\U0001F1E6": "a",
-        u"\U0001F1E7": "b",
-        u"\U0001F1E8": "c",
-        u"\U0001F1E9": "d",
-        u"\U0001F1EA": "e",
-        u"\U0001F1EB": "f",
-        u"\U0001F1EC": "g",
-        u"\U0001F1ED": "h",
-        u"\U0001F1EE": "i",
-        u"\U0001F1EF": "j",
-        u"\U0001F1F0": "k",
-        u"\U0001F1F1": "l",
-        u"\U0001F1F2": "m",
-        u"\U0001F1F3": "n",
-        u"\U0001F1F4": "o",
-        u"\U0001F1F5": "p",
-        u"\U0001F1F6": "q",
-        u"\U0001F1F7": "r",
-        u"\U0001F1F8": "s",
-        u"\U0001F1F9": "t",
-        u"\U0001F1FA": "u",
-        u"\U0001F1FB": "v",
-        u"\U0001F1FC": "w",
-        u"\U0001F1FD": "x",
-        u"\U0001F1FE": "y",
-        u"\U0001F1FF": "z",
-        "0️⃣": 0,
-        "1️⃣": 1,
-        "2️⃣": 2,
-        "3️⃣": 3,
-        "4️⃣": 4,
-        "5️⃣": 5,
-        "6️⃣": 6,
-        "7️⃣": 7,
-        "8️⃣": 8,
-        "9️⃣": 9}
-
-    newS = ''
-
-    i = 0
-
-    while i < len(s):
-        if s[i] in lookupTable:
-            newS += lookupTable[s[i]]
-            i += 1
-        else:
-            newS += s[i]
-        i += 1
-    return newS
+    return REGIONAL_INDICATOR.sub(_indicator_to_letter, s)
 
 
 def textToEmoji(s) -> str:
@@ -0,0 +1,113 @@
+'''
+Comrade - Markov Model
+Compact character level Markov chain used for text generation.
+States (the last few characters) are numbered, and the transitions of
+every state are kept in flat arrays of cumulative weights, so that the
+next state is sampled with a binary search instead of building lists.
+'''
+import random
+from array import array
+from bisect import bisect_right
+from collections import Counter, defaultdict
+
+MODEL_LEN = 3  # Length of text generation model
+
+
+def count_grams(text: str, order: int = MODEL_LEN) -> Counter:
+    '''
+    Number of times each gram (a state and the character after it)
+    appears in a text
+    '''
+    return Counter(text[i:i + order + 1] for i in range(len(text) - order))
+
+
+class TextModel:
+    '''
+    Transitions of state i are targets[offsets[i]:offsets[i + 1]],
+    with the matching slice of cumulative holding their running weights.
+    State i is the text states[i * order:(i + 1) * order].
+    '''
+    __slots__ = ("order", "states", "offsets", "targets", "cumulative",
+                 "starts")
+
+    def __init__(self, text: str = "", order: int = MODEL_LEN):
+        self.order = order
+
+        ids = {}  # state -> id, only needed while building
+        sequence = [ids.setdefault(text[i:i + order], len(ids))
+                    for i in range(len(text) - order + 1)]
+
+        transitions = defaultdict(dict)
+        for (current, following), count in Counter(
+                zip(sequence, sequence[1:])).items():
+            transitions[current][following] = count
+
+        self.compile(ids, transitions)
+
+    @classmethod
+    def from_counts(cls, counts: dict, order: int = MODEL_LEN):
+        '''
+        Builds a model from the number of times
+        each gram (order + 1 characters) was seen
+        '''
+        model = cls.__new__(cls)
+        model.order = order
+
+        ids = {}
+        transitions = defaultdict(dict)
+        for gram, count in counts.items():
+            current = ids.setdefault(gram[:order], len(ids))
+            following = ids.setdefault(gram[1:], len(ids))
+            transitions[current][following] = count
+
+        model.compile(ids, transitions)
+        return model
+
+    def compile(self, ids: dict, transitions: dict):
+        '''
+        Builds the arrays from state -> id and
+        state id -> next state id -> count
+        '''
+        self.states = "".join(ids)
+        self.offsets = array("I", [0])
+        self.targets = array("I")
+        self.cumulative = array("I")
+
+        for state in range(len(ids)):
+            total = 0
+            for following, count in transitions.get(state, {}).items():
+                total += count
+                self.targets.append(following)
+                self.cumulative.append(total)
+            self.offsets.append(len(self.targets))
+
+        self.starts = array("I", transitions)
+        # states with transitions, where text can start
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def state(self, i: int) -> str:
+        return self.states[i * self.order:(i + 1) * self.order]
+
+    def generate(self, num_chars: int) -> str:
+        '''
+        Generates num_chars characters of text
+        '''
+        if not self.starts:
+            return None
+
+        state = random.choice(self.starts)  # select a starting state
+        output = [self.state(state)]
+
+        for _ in range(num_chars):
+            start, end = self.offsets[state], self.offsets[state + 1]
+            if start == end:
+                break
+            # generate next character
+            state = self.targets[bisect_right(
+                self.cumulative, random.randrange(self.cumulative[end - 1]),
+                start, end)]
+            output.append(self.states[(state + 1) * self.order - 1])
+
+        return "".join(output)
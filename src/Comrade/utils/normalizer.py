@@ -0,0 +1,44 @@
+'''
+Comrade - Text Normalizer
+Brings message content into the form used for filtering
+'''
+import re
+from functools import lru_cache
+
+import unidecode
+
+from utils.emoji_converter import emojiToText
+
+NON_WORD = re.compile(r"\W+")
+
+SHORT_TEXT = 256
+# longest text whose transliteration is memoized
+
+
+def _transliterate(s: str) -> str:
+    return unidecode.unidecode(emojiToText(s))
+
+
+_cached_transliterate = lru_cache(maxsize=4096)(_transliterate)
+
+
+def transliterate(s: str) -> str:
+    '''
+    Converts emoji letters and unicode to their closest ascii representation.
+    Ascii text is returned as is, and short text is memoized
+    (repeated messages, common words).
+    '''
+    if s.isascii():
+        return s
+
+    return _cached_transliterate(s) if len(s) <= SHORT_TEXT else \
+        _transliterate(s)
+
+
+def normalize(content: str) -> tuple:
+    '''
+    Returns the spaced and compact (no non-word characters)
+    forms of a message used for matching
+    '''
+    spaced_query = transliterate(content.lower())
+    return spaced_query, NON_WORD.sub("", spaced_query)
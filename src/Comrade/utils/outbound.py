@@ -0,0 +1,224 @@
+'''
+Comrade - Outbound Scheduler
+Queues requests to Discord (sends, edits, reactions and deletes) by route,
+the kind of request and its channel, much like Discord's rate limit buckets.
+Each route sends its requests in order of priority, and backs off when it is
+rate limited instead of failing. Edits of a message which are still waiting
+are coalesced, so that only the latest one is sent.
+'''
+import time
+import heapq
+import asyncio
+import itertools
+
+import discord
+
+from utils.logger import logger
+
+URGENT = 0
+# moderation, eg. deleting filtered messages
+NORMAL = 1
+LOW = 2
+# cosmetic, eg. reactions and progress updates
+
+MAX_RETRIES = 3
+MAX_BACKOFF = 60.0
+# seconds
+
+
+class Job:
+    __slots__ = ("call", "future", "priority", "sequence", "queued",
+                 "retries", "message_id")
+
+    def __init__(self, call, priority: int, sequence: int):
+        self.call = call  # coroutine function making the request
+        self.future = asyncio.get_running_loop().create_future()
+        self.priority = priority
+        self.sequence = sequence
+        self.queued = time.monotonic()
+        self.retries = 0
+        self.message_id = None  # of a coalescable edit
+
+        # Callers do not have to await the result, so errors are logged here
+        self.future.add_done_callback(self.done)
+
+    @staticmethod
+    def done(future: asyncio.Future):
+        if future.cancelled() or not (e := future.exception()):
+            return
+        if isinstance(e, discord.NotFound):
+            # the target was deleted; routine, and often handled by the caller
+            logger.warning(f"Outbound request failed: {e}")
+        else:
+            logger.error(f"Outbound request failed: {e}", exc_info=e)
+
+    def __lt__(self, other) -> bool:
+        return (self.priority, self.sequence) < \
+            (other.priority, other.sequence)
+
+
+class Route:
+    __slots__ = ("queue", "resume", "backoff", "worker")
+
+    def __init__(self):
+        self.queue = []  # heap of jobs
+        self.resume = 0.0  # nothing is sent before this time
+        self.backoff = 0.0
+        self.worker = None
+
+
+class Outbound:
+    '''
+    Per-route queues of requests, each run by a worker task
+    which exists only while the route has requests waiting
+    '''
+    def __init__(self):
+        self.routes = {}  # (kind, channel id) -> Route
+        self.edits = {}  # message id -> (fields, job) of a waiting edit
+        self.sequence = itertools.count()
+
+        self.resume = 0.0  # for every route, after a global rate limit
+        self.backoff = 0.0
+
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth = 0
+
+    def depth(self) -> int:
+        return sum(len(route.queue) for route in self.routes.values())
+
+    def queue(self, route: tuple, call, priority: int = NORMAL) -> Job:
+        job = Job(call, priority, next(self.sequence))
+        state = self.routes.setdefault(route, Route())
+        heapq.heappush(state.queue, job)
+        self.max_depth = max(self.max_depth, self.depth())
+
+        if state.worker is None:
+            state.worker = asyncio.create_task(self.run(route, state))
+        return job
+
+    def submit(self, route: tuple, call,
+               priority: int = NORMAL) -> asyncio.Future:
+        '''
+        Queues a request, given as a coroutine function.
+        Returns a future of its result.
+        '''
+        return self.queue(route, call, priority).future
+
+    def send(self, destination, priority: int = NORMAL,
+             **kwargs) -> asyncio.Future:
+        '''
+        Sends a message to a channel, context, user or webhook.
+        Files are rewound before every attempt, since retries send them again.
+        '''
+        if isinstance(destination, discord.Webhook):
+            route = ("webhook", destination.id)
+            # webhooks are rate limited separately from their channel
+        else:
+            route = ("send", getattr(destination, "channel", destination).id)
+        files = [kwargs.get("file")] + (kwargs.get("files") or [])
+
+        async def call():
+            for f in files:
+                if f:
+                    f.reset()
+            return await destination.send(**kwargs)
+
+        return self.submit(route, call, priority)
+
+    def edit(self, message: discord.Message, priority: int = LOW,
+             **fields) -> asyncio.Future:
+        '''
+        Edits a message. If an edit of it is still waiting,
+        that edit is updated instead, so only the latest is sent.
+        '''
+        if pending := self.edits.get(message.id):
+            pending[0].update(fields)
+            self.coalesced += 1
+            return pending[1].future
+
+        job = self.queue(("edit", message.channel.id),
+                         lambda: message.edit(**fields), priority)
+        job.message_id = message.id
+        self.edits[message.id] = (fields, job)
+        return job.future
+
+    def react(self, message: discord.Message, emoji,
+              priority: int = LOW) -> asyncio.Future:
+        return self.submit(("react", message.channel.id),
+                           lambda: message.add_reaction(emoji), priority)
+
+    def delete(self, message: discord.Message,
+               priority: int = URGENT) -> asyncio.Future:
+        return self.submit(("delete", message.channel.id),
+                           message.delete, priority)
+
+    def back_off(self, state=None):
+        '''
+        Pauses a route, or every route, for twice as long as last time
+        '''
+        state = state or self
+        state.backoff = min(max(state.backoff * 2, 1.0), MAX_BACKOFF)
+        state.resume = time.monotonic() + state.backoff
+        self.rate_limited += 1
+
+    async def run(self, route: tuple, state: Route):
+        try:
+            while state.queue:
+                if (wait := max(state.resume, self.resume) -
+                        time.monotonic()) > 0:
+                    await asyncio.sleep(wait)
+                    continue  # more urgent requests may have arrived
+
+                job = heapq.heappop(state.queue)
+                if job.message_id is not None:
+                    self.edits.pop(job.message_id, None)
+                    # later edits are queued separately
+                if job.future.done():
+                    continue  # cancelled by the caller
+
+                waited = time.monotonic() - job.queued
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+                try:
+                    result = await job.call()
+                except discord.HTTPException as e:
+                    if (e.status == 429 or e.status >= 500) and \
+                            job.retries < MAX_RETRIES:
+                        # slow down, and try again
+                        job.retries += 1
+                        self.back_off(state)
+                        logger.warning(f"Outbound request on {route} failed "
+                                       f"({e.status}), retrying in "
+                                       f"{state.backoff}s")
+                        heapq.heappush(state.queue, job)
+                    elif not job.future.done():
+                        job.future.set_exception(e)
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    self.sent += 1
+                    state.backoff /= 2
+                    self.backoff /= 2
+                    if not job.future.done():
+                        # the caller may have been cancelled meanwhile
+                        job.future.set_result(result)
+        finally:
+            state.worker = None
+            if self.routes.get(route) is state:
+                del self.routes[route]
+
+    def info(self) -> str:
+        return (f"Outbound(depth={self.depth()}, max_depth={self.max_depth}, "
+                f"sent={self.sent}, coalesced={self.coalesced}, "
+                f"rate_limited={self.rate_limited}, mean_wait="
+                f"{round(self.total_wait / self.sent * 1000, 1) if self.sent else 0} ms, "
+                f"max_wait={round(self.max_wait * 1000, 1)} ms)")
+
+
+outbound = Outbound()
@@ -1,22 +1,24 @@
 from discord.ext import commands
 
+from utils.outbound import outbound
+
 
 async def reactOK(ctx: commands.Context):
     '''
     Adds reaction to show that task was completed successfully.
     '''
-    await ctx.message.add_reaction("👍")
+    await outbound.react(ctx.message, "👍")
 
 
 async def reactX(ctx: commands.Context):
     '''
     Adds reaction to show that task was forbidden.
     '''
-    await ctx.message.add_reaction("❌")
+    await outbound.react(ctx.message, "❌")
 
 
 async def reactQuestion(ctx: commands.Context):
     '''
     Adds reaction to show that something went wrong
     '''
-    await ctx.message.add_reaction("❓")
+    await outbound.react(ctx.message, "❓")
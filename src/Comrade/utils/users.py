@@ -2,7 +2,8 @@ import discord
 import random
 import datetime
 from client import client as bot
-from db import collection
+from db import (collection, server_cfg as get_server_cfg,
+                drop_user_profiles)
 from config import cfg
 from utils.utilities import ufil
 from utils.logger import logger
@@ -60,13 +61,14 @@ async def rebuild_weight_table(guild: discord.Guild):
     Refills the daily member counts according to staleness rules.
     '''
     # Attempt to set default daily count
-    server_cfg: dict = collection("servers").find_one(guild.id)
+    server_cfg: dict = get_server_cfg(guild.id)
 
     if server_cfg["default-daily-count"] == 0:
         # Daily member turned off
         for member in guild.members:
             collection("users").update_one(
                 ufil(member), {"$set": {"daily-weight": 0}})
+        drop_user_profiles(server=guild.id)
         return
 
     logger.warning(
@@ -103,5 +105,6 @@ async def rebuild_weight_table(guild: discord.Guild):
         collection("users").update_one(
             ufil(member), {"$set": {"daily-weight": daily}})
 
+    drop_user_profiles(server=guild.id)
     logger.info(
         f"{guild.name}: Rebuilt weights for users in past {staleness} days")
@@ -1,16 +1,19 @@
 import discord
 
 import time
+import asyncio
 import pytz
 import datetime
 import socket
 from urllib.parse import urlparse
+from collections import deque
 
 from config import cfg
 
 
 bot_prefix = cfg["Settings"]["prefix"].strip("\"")
 startup_time = None
+loop_lag_samples = deque(maxlen=120)
 
 
 def set_start_time(time):
@@ -29,6 +32,28 @@ def get_uptime() -> float:
     return time.perf_counter() - startup_time
 
 
+async def monitor_loop_lag(interval: float = 0.5):
+    '''
+    Measures how late the event loop wakes up from a sleep.
+    Anything blocking the loop (eg. synchronous database calls)
+    shows up directly as lag.
+    '''
+    while True:
+        t_start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag_samples.append(time.perf_counter() - t_start - interval)
+
+
+def get_loop_lag() -> tuple:
+    '''
+    Returns (mean, max) event loop lag in ms over the recent sample window
+    '''
+    if not loop_lag_samples:
+        return 0, 0
+    return (1000 * sum(loop_lag_samples) / len(loop_lag_samples),
+            1000 * max(loop_lag_samples))
+
+
 def local_time() -> datetime.datetime:
     '''
     Returns local time.
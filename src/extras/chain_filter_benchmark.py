@@ -0,0 +1,65 @@
+'''
+Benchmark for the message chain check of the text filter.
+Compares re-checking the whole joined window on every message
+with the incremental boundary check, as the buffer limit grows.
+
+Run from src/Comrade (it needs the configuration file):
+    python ../extras/chain_filter_benchmark.py
+'''
+import sys
+import time
+import random
+import string
+
+sys.path.insert(0, ".")
+
+from components.servertools.text_filter import (  # noqa: E402
+    BannedWordMatcher, ChainWindow, normalize)
+
+MESSAGES = 2000
+LIMITS = [5, 20, 80, 320]
+
+random.seed(0)
+
+server_words = {"".join(random.choices(string.ascii_lowercase, k=7)):
+                random.choice([80, 90, 100]) for _ in range(50)}
+matcher = BannedWordMatcher(0, server_words, {})
+
+
+def sentence() -> str:
+    return " ".join("".join(random.choices(string.ascii_lowercase,
+                                           k=random.randint(2, 8)))
+                    for _ in range(random.randint(3, 12)))
+
+
+messages = [sentence() for _ in range(MESSAGES)]
+
+
+def full_rejoin(limit: int) -> float:
+    chain = []
+    t_start = time.perf_counter()
+    for content in messages:
+        chain.append(content)
+        spaced_query, query = normalize(" ".join(chain))
+        matcher.matches(query, spaced_query.split(" "))
+        if len(chain) > limit:
+            chain.pop(0)
+    return (time.perf_counter() - t_start) / MESSAGES
+
+
+def incremental(limit: int) -> float:
+    window = ChainWindow()
+    t_start = time.perf_counter()
+    for content in messages:
+        _, query = normalize(content)
+        matcher.matches_appended(window, query)
+        window.append((0, 0), query)
+        if len(window.ids) > limit:
+            window.pop()
+    return (time.perf_counter() - t_start) / MESSAGES
+
+
+print(f"{'limit':>6} {'full re-join (us)':>18} {'incremental (us)':>17}")
+for limit in LIMITS:
+    print(f"{limit:>6} {full_rejoin(limit) * 1e6:>18.1f} "
+          f"{incremental(limit) * 1e6:>17.1f}")
@@ -0,0 +1,82 @@
+'''
+Benchmark for the text generation model, comparing the compact
+array-backed TextModel with the previous dict of Counters
+(memory per model, build time, and time to generate 200 characters).
+
+Run from src/Comrade:
+    python ../extras/markov_benchmark.py
+'''
+import sys
+import time
+import random
+import tracemalloc
+from collections import Counter, defaultdict
+
+sys.path.insert(0, ".")
+
+from utils.markov import TextModel, MODEL_LEN  # noqa: E402
+
+MESSAGES = [100, 1000, 10000]
+# 100 is what gen reads from history
+CHARS = 200
+RUNS = 200
+
+random.seed(0)
+
+words = ["".join(random.choices("abcdefghijklmnopqrstuvwxyz",
+                                k=random.randint(1, 9)))
+         for _ in range(3000)]
+weights = [1 / (rank + 1) for rank in range(len(words))]
+# word frequencies roughly follow Zipf's law
+
+
+def message() -> str:
+    return " ".join(random.choices(words, weights, k=random.randint(3, 15)))
+
+
+def legacy_model(text: str):
+    model = defaultdict(Counter)
+    for i in range(len(text) - MODEL_LEN):
+        model[text[i:(i + MODEL_LEN)]][text[i + MODEL_LEN]] += 1
+    return model
+
+
+def legacy_generate(model, num_chars):
+    selector = random.choice(list(model.keys()))
+    output = selector
+    for i in range(num_chars):
+        if len(model[selector]) == 0:
+            break
+        output += random.choices(list(model[selector]),
+                                 model[selector].values())[0]
+        selector = output[-MODEL_LEN:]
+    return output
+
+
+def measure(build, generate, text: str) -> tuple:
+    t_start = time.perf_counter()
+    build(text)
+    built = time.perf_counter() - t_start
+
+    tracemalloc.start()
+    model = build(text)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    t_start = time.perf_counter()
+    for _ in range(RUNS):
+        generate(model, CHARS)
+    generated = (time.perf_counter() - t_start) / RUNS
+    return memory, built, generated
+
+
+print(f"{'messages':>8} {'model':>8} {'memory (KB)':>12} "
+      f"{'build (ms)':>11} {'generate (us)':>14}")
+for count in MESSAGES:
+    text = " ".join(message() for _ in range(count))
+    for name, build, generate in (
+            ("legacy", legacy_model, legacy_generate),
+            ("compact", TextModel, lambda m, n: m.generate(n))):
+        memory, built, generated = measure(build, generate, text)
+        print(f"{count:>8} {name:>8} {memory / 1024:>12.1f} "
+              f"{built * 1000:>11.1f} {generated * 1e6:>14.1f}")
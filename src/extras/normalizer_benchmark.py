@@ -0,0 +1,70 @@
+'''
+Microbenchmark for the text filter's normalization
+(emoji letters, unicode transliteration, compact form),
+compared with the previous character by character implementation.
+
+Run from src/Comrade:
+    python ../extras/normalizer_benchmark.py
+'''
+import re
+import sys
+import timeit
+import random
+import string
+
+import unidecode
+
+sys.path.insert(0, ".")
+
+from utils.normalizer import normalize, _cached_transliterate  # noqa: E402
+
+LENGTHS = [10, 40, 120, 400, 2000]
+# typical Discord messages, up to the 2000 character limit
+RUNS = 2000
+
+random.seed(0)
+
+
+def legacy_emoji_to_text(s) -> str:
+    lookupTable = {chr(0x1F1E6 + i): c
+                   for i, c in enumerate(string.ascii_lowercase)}
+    newS = ''
+    i = 0
+    while i < len(s):
+        if s[i] in lookupTable:
+            newS += lookupTable[s[i]]
+            i += 1
+        else:
+            newS += s[i]
+        i += 1
+    return newS
+
+
+def legacy_normalize(content: str) -> tuple:
+    spaced_query = unidecode.unidecode(legacy_emoji_to_text(content.lower()))
+    return spaced_query, re.sub(r"\W+", '', spaced_query)
+
+
+def message(length: int, alphabet: str) -> str:
+    return "".join(random.choices(alphabet, k=length))
+
+
+ascii_text = string.ascii_letters + "      .,!?"
+mixed_text = ascii_text + "éüñ" + "".join(chr(0x1F1E6 + i) for i in range(26))
+
+print(f"{'length':>6} {'text':>6} {'legacy (us)':>12} {'cold (us)':>10} "
+      f"{'repeated (us)':>14}")
+for length in LENGTHS:
+    for name, alphabet in (("ascii", ascii_text), ("mixed", mixed_text)):
+        samples = [message(length, alphabet) for _ in range(RUNS)]
+        assert all(normalize(s) == legacy_normalize(s) for s in samples)
+        _cached_transliterate.cache_clear()
+
+        legacy = timeit.timeit(
+            lambda: [legacy_normalize(s) for s in samples], number=1)
+        cold = timeit.timeit(lambda: [normalize(s) for s in samples], number=1)
+        repeated = timeit.timeit(
+            lambda: [normalize(s) for s in samples], number=1)
+
+        print(f"{length:>6} {name:>6} {legacy / RUNS * 1e6:>12.2f} "
+              f"{cold / RUNS * 1e6:>10.2f} {repeated / RUNS * 1e6:>14.2f}")